@@ -0,0 +1,135 @@
+"""File .docx nhỏ dựng tay (không cần python-docx) cho các test của tron_de."""
+
+import io
+import os
+import sys
+import zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+R_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Default Extension="bin" ContentType="application/vnd.openxmlformats-officedocument.oleObject"/>'
+    '<Default Extension="wmf" ContentType="image/x-wmf"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/header1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.header+xml"/>'
+    '</Types>'
+)
+
+ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+DOCUMENT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rIdH" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/header" '
+    'Target="header1.xml"/>'
+    '<Relationship Id="rIdO" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/oleObject" '
+    'Target="embeddings/oleObject1.bin"/>'
+    '<Relationship Id="rIdI" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image" '
+    'Target="media/image1.wmf"/>'
+    '</Relationships>'
+)
+
+HEADER = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    f'<w:hdr xmlns:w="{W_NS}"><w:p><w:r><w:t xml:space="preserve">Mã đề: </w:t></w:r>'
+    '<w:r><w:t>{{MA_</w:t></w:r><w:r><w:t>DE}}</w:t></w:r></w:p></w:hdr>'
+)
+
+
+def _run(text, underline=False):
+    rpr = '<w:rPr><w:u w:val="single"/></w:rPr>' if underline else ""
+    return f'<w:r>{rpr}<w:t xml:space="preserve">{text}</w:t></w:r>'
+
+
+def _p(*runs):
+    return "<w:p>" + "".join(runs) + "</w:p>"
+
+
+OLE_RUN = (
+    '<w:r><w:object w:dxaOrig="300" w:dyaOrig="300">'
+    '<v:shape id="_x0000_i1025" type="#_x0000_t75" style="width:15pt;height:15pt">'
+    '<v:imagedata r:id="rIdI" o:title=""/></v:shape>'
+    '<o:OLEObject Type="Embed" ProgID="Equation.DSMT4" ShapeID="_x0000_i1025" DrawAspect="Content" '
+    'ObjectID="_1" r:id="rIdO"/></w:object></w:r>'
+)
+
+MATH_RUN = '<m:oMath><m:r><m:t>x+1</m:t></m:r></m:oMath>'
+
+TEXT_BOX_RUN = (
+    '<w:r><w:pict><v:shape id="tb1" style="width:80pt;height:20pt"><v:textbox><w:txbxContent>'
+    '<w:p><w:r><w:t>Mã đề {{MA_DE_2CUOI}} / {MA_DE_2DAU}</w:t></w:r></w:p>'
+    '</w:txbxContent></v:textbox></v:shape></w:pict></w:r>'
+)
+
+
+def build_docx(n_mcq=6, n_tf=3, n_short=3):
+    """
+    Đề 3 phần: gạch chân làm đáp án, token {{MA_DE}} bị tách qua nhiều run (thân đề + header),
+    text box chứa token, phương án có OLE (MathType) và công thức m:oMath, ảnh/OLE chép nguyên khối.
+    """
+    body = [
+        _p(_run("SỞ GD&amp;ĐT &lt;TEST&gt;")),
+        _p(_run("Mã đề thi: "), _run("{{MA_"), _run("DE}}"), _run(" / {"), _run("MA_DE_2CUOI}")),
+        _p(TEXT_BOX_RUN),
+        _p(_run("PHẦN 1. Trắc nghiệm nhiều lựa chọn")),
+    ]
+    for q in range(1, n_mcq + 1):
+        body.append(_p(_run(f"Câu {q}. Nội dung câu hỏi {q}"), OLE_RUN if q == 2 else ""))
+        for k, letter in enumerate("ABCD"):
+            extra = MATH_RUN if q == 3 and k == 1 else ""
+            if q % 3 == 0:
+                body.append(_p(_run(letter), _run(". "), _run(f"Phương án {letter}{q}", k == q % 4), extra))
+            else:
+                body.append(_p(_run(f"{letter}. "), _run(f"Phương án {letter}{q}", k == q % 4), extra))
+    body.append(_p(_run("PHẦN 2. Trắc nghiệm đúng sai")))
+    for q in range(1, n_tf + 1):
+        body.append(_p(_run(f"Câu {q}. Cho mệnh đề {q}")))
+        for k, letter in enumerate("abcd"):
+            body.append(_p(_run(f"{letter}) "), _run(f"Ý {letter}{q}", (k + q) % 2 == 0)))
+    body.append(_p(_run("PHẦN 3. Trả lời ngắn")))
+    for q in range(1, n_short + 1):
+        body.append(_p(_run(f"Câu {q}. Tính giá trị {q}"), OLE_RUN if q == 1 else ""))
+        body.append(_p(_run(f"Đáp án: {q},5")))
+    body.append(_p(_run("--- HẾT ---")))
+
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<w:document xmlns:w="{W_NS}" xmlns:r="{R_NS}" xmlns:v="urn:schemas-microsoft-com:vml" '
+        'xmlns:o="urn:schemas-microsoft-com:office:office" '
+        'xmlns:m="http://schemas.openxmlformats.org/officeDocument/2006/math">'
+        "<w:body>" + "".join(body)
+        + '<w:sectPr><w:headerReference w:type="default" r:id="rIdH"/></w:sectPr></w:body></w:document>'
+    )
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("[Content_Types].xml", CONTENT_TYPES)
+        z.writestr("_rels/.rels", ROOT_RELS)
+        z.writestr("word/_rels/document.xml.rels", DOCUMENT_RELS)
+        z.writestr("word/document.xml", document)
+        z.writestr("word/header1.xml", HEADER)
+        z.writestr("word/embeddings/oleObject1.bin", bytes(range(256)) * 64)
+        z.writestr("word/media/image1.wmf", os.urandom(2048) + bytes(4096))
+    return buf.getvalue()
+
+
+@pytest.fixture(scope="session")
+def docx_bytes():
+    return build_docx()
@@ -0,0 +1,86 @@
+"""File đáp án CSV dài / CSV theo mã đề / JSON trong ZIP cả lô khớp với plan và đọc lại được để chấm."""
+
+import csv
+import io
+import json
+import zipfile
+
+import pytest
+
+import tron_de
+
+CODES = [101, 102, 103, 104]
+SEED = "exports"
+FORMATS = ("xlsx", "csv", "wide", "json")
+
+
+@pytest.fixture(scope="module")
+def batch(docx_bytes):
+    template = tron_de.compile_docx_template(docx_bytes)
+    plan = tron_de.build_shuffle_plan(template, CODES, SEED)
+    data = tron_de.build_batch_zip(template, plan, "De", "2cuoi", SEED, answer_formats=FORMATS)
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        files = {name: z.read(name) for name in z.namelist()}
+    return plan, files
+
+
+def _expected(plan):
+    """{mã đề: {phần: [đáp án...]}} lấy thẳng từ plan."""
+    table = plan.answer_table()
+    return {code: {part: table[part][v].tolist() for part in table} for v, code in enumerate(plan.codes)}
+
+
+def test_every_selected_export_is_written(batch):
+    _, files = batch
+    for fmt in FORMATS:
+        assert tron_de.ANSWER_EXPORTS[fmt][0] in files
+    assert sum(name.endswith(".docx") for name in files) == len(CODES)
+
+
+def test_long_csv_matches_plan(batch):
+    plan, files = batch
+    rows = list(csv.reader(io.StringIO(files["DAPAN_DAI.csv"].decode("utf-8"))))
+    assert rows[0] == ["ma_de", "part", "question", "answer"]
+
+    got = {}
+    for ma_de, part, question, answer in rows[1:]:
+        answers = got.setdefault(int(ma_de), {}).setdefault(int(part), [])
+        assert int(question) == len(answers) + 1
+        answers.append(answer)
+    assert got == _expected(plan)
+
+
+def test_wide_csv_matches_plan(batch):
+    plan, files = batch
+    rows = list(csv.reader(io.StringIO(files["DAPAN_THEO_MA_DE.csv"].decode("utf-8"))))
+    header = rows[0]
+    got = {}
+    for row in rows[1:]:
+        answers = got.setdefault(int(row[0]), {})
+        for name, value in zip(header[1:], row[1:]):
+            part, question = tron_de.KEY_COLUMN_RE.match(name).groups()
+            assert int(question) == len(answers.setdefault(int(part), [])) + 1
+            answers[int(part)].append(value)
+    assert got == _expected(plan)
+
+
+def test_json_matches_plan(batch):
+    plan, files = batch
+    doc = json.loads(files["DAPAN.json"].decode("utf-8"))
+    assert doc["seed"] == SEED and doc["ma_de_mode"] == "2cuoi"
+    table = plan.answer_table()
+    assert doc["questions"] == {str(part): table[part].shape[1] for part in table}
+    got = {v["ma_de"]: {int(part): answers for part, answers in v["answers"].items()} for v in doc["versions"]}
+    assert got == _expected(plan)
+
+
+@pytest.mark.parametrize("name", ["DAPAN_DAI.csv", "DAPAN_THEO_MA_DE.csv", "DAPAN.json"])
+def test_grading_reads_exports_back(batch, name):
+    plan, files = batch
+    key = tron_de.AnswerKey.from_file(files[name], name)
+    reference = tron_de.AnswerKey.from_plan(plan)
+
+    assert key.codes.tolist() == reference.codes.tolist()
+    assert sorted(key.table) == sorted(reference.table)
+    for part in reference.table:
+        assert key.table[part].tolist() == reference.table[part].tolist()
@@ -0,0 +1,101 @@
+"""Bảng đáp án .xlsx ghi thẳng SpreadsheetML: mở lại và đọc từng ô, merge, freeze pane."""
+
+import io
+import zipfile
+import xml.etree.ElementTree as ET
+
+import tron_de
+
+NS = {"s": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+ANSWERS = [
+    [
+        {"part": 1, "q": 1, "answer": "A"}, {"part": 1, "q": 2, "answer": "C"}, {"part": 1, "q": 3, "answer": "A"},
+        {"part": 2, "q": 1, "answer": "ĐSĐS"},
+        {"part": 3, "q": 1, "answer": " 1,5"}, {"part": 3, "q": 2, "answer": "<5 & >2"},
+    ],
+    [
+        {"part": 1, "q": 1, "answer": "B"}, {"part": 1, "q": 2, "answer": "D"},
+        {"part": 2, "q": 1, "answer": "SSĐĐ"},
+        {"part": 3, "q": 1, "answer": "3"}, {"part": 3, "q": 2, "answer": "-2"},
+    ],
+]
+
+
+def _read_xlsx(data):
+    """{ô: giá trị} (chuỗi chung đã tra ra), danh sách merge, pane và gốc sheet."""
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        assert z.testzip() is None
+        names = set(z.namelist())
+        types = ET.fromstring(z.read("[Content_Types].xml"))
+        for override in types:
+            if override.get("PartName"):
+                assert override.get("PartName").lstrip("/") in names
+        sst = ET.fromstring(z.read("xl/sharedStrings.xml"))
+        sheet = ET.fromstring(z.read("xl/worksheets/sheet1.xml"))
+        ET.fromstring(z.read("xl/styles.xml"))
+        ET.fromstring(z.read("xl/workbook.xml"))
+
+    strings = ["".join(t.text or "" for t in si.iter(f"{{{NS['s']}}}t")) for si in sst.findall("s:si", NS)]
+    assert int(sst.get("uniqueCount")) == len(strings) == len(set(strings))
+
+    cells = {}
+    shared_refs = 0
+    for c in sheet.iter(f"{{{NS['s']}}}c"):
+        v = c.find("s:v", NS)
+        if v is None:
+            continue
+        if c.get("t") == "s":
+            shared_refs += 1
+            cells[c.get("r")] = strings[int(v.text)]
+        else:
+            cells[c.get("r")] = int(v.text)
+    assert int(sst.get("count")) == shared_refs
+
+    merges = [m.get("ref") for m in sheet.findall("s:mergeCells/s:mergeCell", NS)]
+    pane = sheet.find("s:sheetViews/s:sheetView/s:pane", NS)
+    return cells, merges, pane, sheet
+
+
+def test_cells_merges_and_freeze_pane():
+    cells, merges, pane, sheet = _read_xlsx(tron_de.build_answer_table_xlsx(ANSWERS, start_code=201))
+
+    # cột: A = mã đề, B-D = PHẦN 1 (3 câu), E = PHẦN 2, F-G = PHẦN 3
+    assert cells["B1"] == "Trắc nghiệm khách quan"
+    assert cells["E1"] == "Trắc nghiệm đúng sai"
+    assert cells["F1"] == "Trắc nghiệm trả lời ngắn"
+    assert merges == ["B1:D1", "E1:E1", "F1:G1"]
+    assert [cells[f"{col}2"] for col in "ABCDEFG"] == ["Mã đề", "Câu 1", "Câu 2", "Câu 3", "Câu 1", "Câu 1", "Câu 2"]
+
+    assert [cells.get(f"{col}3") for col in "ABCDEFG"] == [201, "A", "C", "A", "ĐSĐS", " 1,5", "<5 & >2"]
+    assert [cells.get(f"{col}4") for col in "ABCDEFG"] == [202, "B", "D", None, "SSĐĐ", "3", "-2"]
+
+    assert pane.get("topLeftCell") == "B3" and pane.get("state") == "frozen"
+    assert (pane.get("xSplit"), pane.get("ySplit")) == ("1", "2")
+    assert sheet.find("s:dimension", NS).get("ref") == "A1:G4"
+
+
+def test_plan_answers_round_trip(docx_bytes):
+    template = tron_de.compile_docx_template(docx_bytes)
+    plan = tron_de.build_shuffle_plan(template, [101, 102, 103], "xlsx")
+    cells, merges, _, _ = _read_xlsx(tron_de.build_answer_table_xlsx(plan.answers(), start_code=101))
+
+    table = plan.answer_table()
+    columns = [(part, q) for part in (1, 2, 3) for q in range(table[part].shape[1])]
+    assert len(merges) == 3
+    for v, code in enumerate(plan.codes):
+        row = 3 + v
+        assert cells[f"A{row}"] == code
+        for c, (part, q) in enumerate(columns, 2):
+            assert cells[f"{tron_de.column_letter(c)}{row}"] == table[part][v, q]
+
+
+def test_out_writes_the_same_workbook():
+    out = io.BytesIO()
+    assert tron_de.build_answer_table_xlsx(ANSWERS, start_code=201, out=out) is out
+    assert _read_xlsx(out.getvalue())[0] == _read_xlsx(tron_de.build_answer_table_xlsx(ANSWERS, start_code=201))[0]
+
+
+def test_column_letters():
+    assert [tron_de.column_letter(c) for c in (1, 26, 27, 52, 53, 702, 703, 16384)] == \
+        ["A", "Z", "AA", "AZ", "BA", "ZZ", "AAA", "XFD"]
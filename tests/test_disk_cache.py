@@ -0,0 +1,52 @@
+"""Cache template trên đĩa: lưu/đọc lại đúng, không tin file của người khác."""
+
+import hashlib
+import os
+import stat
+
+import pytest
+
+import tron_de
+
+
+def _template_and_hash(docx_bytes):
+    template = tron_de.compile_docx_template(docx_bytes)
+    return template, template.source_hash
+
+
+def test_round_trip_renders_same_bytes(docx_bytes, tmp_path):
+    cache = tron_de.DiskTemplateCache(str(tmp_path / "cache"), 1 << 24)
+    template, source_hash = _template_and_hash(docx_bytes)
+    cache.save(template)
+
+    loaded = cache.load(docx_bytes, source_hash)
+    assert loaded is not None
+    orders = tron_de.build_shuffle_plan(template, [101], "disk").version_orders(0)
+    assert loaded.render(orders, ma_de=101) == template.render(orders, ma_de=101)
+
+
+def test_directory_is_private(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir(mode=0o777)
+    os.chmod(directory, 0o777)
+    tron_de.DiskTemplateCache(str(directory), 1 << 20)
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="không có quyền sở hữu kiểu POSIX")
+def test_writable_by_others_is_ignored(docx_bytes, tmp_path):
+    cache = tron_de.DiskTemplateCache(str(tmp_path / "cache"), 1 << 24)
+    template, source_hash = _template_and_hash(docx_bytes)
+    cache.save(template)
+
+    path = cache._path(source_hash, "auto")
+    os.chmod(path, 0o666)
+    assert cache.load(docx_bytes, source_hash) is None
+
+
+def test_garbage_file_is_a_miss(docx_bytes, tmp_path):
+    cache = tron_de.DiskTemplateCache(str(tmp_path / "cache"), 1 << 24)
+    source_hash = hashlib.sha256(docx_bytes).hexdigest()
+    with open(cache._path(source_hash, "auto"), "wb") as f:
+        f.write(b"\x80\x04cos\nsystem\n")
+    assert cache.load(docx_bytes, source_hash) is None
@@ -0,0 +1,128 @@
+"""Chấm bài theo thang điểm 2025 trên 1 phiếu đáp án nhỏ tính tay."""
+
+import json
+
+import numpy as np
+import pytest
+
+import tron_de
+
+KEY_CSV = (
+    "ma_de,P1.C1,P1.C2,P2.C1,P2.C2,P3.C1,P3.C2\n"
+    '101,A,C,ĐSĐS,ĐĐĐĐ,"1,5",-2\n'
+    '102,B,D,SSĐĐ,SĐSĐ,3,"0,25"\n'
+)
+
+KEY_JSON = {
+    "seed": "x",
+    "versions": [
+        {"ma_de": 101, "answers": {"1": ["A", "C"], "2": ["ĐSĐS", "ĐĐĐĐ"], "3": ["1,5", "-2"]}},
+        {"ma_de": 102, "answers": {"1": ["B", "D"], "2": ["SSĐĐ", "SĐSĐ"], "3": ["3", "0,25"]}},
+    ],
+}
+
+RESPONSES_CSV = (
+    "SBD,Ma_De,P1.C1,P1.C2,P2.C1,P2.C2,P3.C1,P3.C2\n"
+    "HS1,101,A,C,ĐSĐS,ĐĐĐĐ,1.5,-2\n"        # đúng hết
+    'HS2,101,b,,ĐSSS,SSSS,"1,50",2\n'         # P2: 3 ý / 0 ý; P3: 1,50 = 1,5
+    "HS3,102,B,A,SSĐ,SĐSĐ,3,.25\n"            # ý thứ 4 bỏ trống; .25 = 0,25
+    "HS4,999,A,C,ĐSĐS,ĐĐĐĐ,1.5,-2\n"        # mã đề không có trong lô
+    "HS5,102,b,d,SĐĐĐ,SĐSS,3,1\n"             # chữ thường vẫn được tính
+    "HS6,101,,,ĐĐĐĐ,ĐSSS,,\n"                # P2: 2 ý -> 0,25 và 1 ý -> 0,1
+    "HS7,abc,A,C,ĐSĐS,ĐĐĐĐ,1.5,-2\n"        # mã đề không phải số
+    "\n"
+)
+
+# tính tay: (P1, P2, P3) mỗi học sinh, P3 = 0,25 mỗi câu
+EXPECTED = {
+    "HS1": (0.5, 2.0, 0.5),
+    "HS2": (0.0, 0.5, 0.25),
+    "HS3": (0.25, 1.5, 0.5),
+    "HS4": (0.0, 0.0, 0.0),
+    "HS5": (0.5, 1.0, 0.25),
+    "HS6": (0.0, 0.35, 0.0),
+    "HS7": (0.0, 0.0, 0.0),
+}
+
+
+def _grade(key, short_point=tron_de.SHORT_POINT):
+    return tron_de.grade_responses(key, tron_de.read_responses_csv(RESPONSES_CSV.encode("utf-8")), short_point)
+
+
+def _by_student(result):
+    return {
+        sbd: tuple(float(result["scores"][part][i]) for part in (1, 2, 3))
+        for i, sbd in enumerate(result["sbd"])
+    }
+
+
+def test_scoring_rules_from_csv_key():
+    key = tron_de.AnswerKey.from_file(KEY_CSV.encode("utf-8"), "DAPAN_THEO_MA_DE.csv")
+    result = _grade(key)
+
+    assert result["sbd"] == list(EXPECTED)
+    assert _by_student(result) == pytest.approx(EXPECTED)
+    assert result["total"].tolist() == pytest.approx([round(sum(v), 2) for v in EXPECTED.values()])
+    assert result["unknown"] == 2
+    assert result["ma_de"].tolist() == [101, 101, 102, 999, 102, 101, -1]
+
+
+def test_short_answer_math_point():
+    key = tron_de.AnswerKey.from_file(KEY_CSV.encode("utf-8"), "DAPAN_THEO_MA_DE.csv")
+    result = _grade(key, tron_de.SHORT_POINT_MATH)
+    assert result["scores"][3].tolist() == [1.0, 0.5, 1.0, 0.0, 0.5, 0.0, 0.0]
+
+
+def test_json_key_matches_csv_key():
+    from_csv = tron_de.AnswerKey.from_file(KEY_CSV.encode("utf-8"), "DAPAN_THEO_MA_DE.csv")
+    from_json = tron_de.AnswerKey.from_file(json.dumps(KEY_JSON, ensure_ascii=False).encode("utf-8"), "DAPAN.json")
+
+    assert from_json.codes.tolist() == from_csv.codes.tolist()
+    for part in (1, 2, 3):
+        assert from_json.table[part].tolist() == from_csv.table[part].tolist()
+    assert _by_student(_grade(from_json)) == _by_student(_grade(from_csv))
+
+
+def test_tf_ladder_and_short_answer_normalization():
+    assert tron_de.TF_POINTS.tolist() == [0.0, 0.1, 0.25, 0.5, 1.0]
+    assert tron_de.normalize_short_answer(" 1,50 ") == "1.5"
+    assert tron_de.normalize_short_answer("-0,250") == "-0.25"
+    assert tron_de.normalize_short_answer("x y") == "XY"
+    assert tron_de._tf_codes("đs-") == [1, 0, -1, -1]
+
+
+def test_bad_key_file_is_rejected():
+    with pytest.raises(Exception, match="ma_de"):
+        tron_de.AnswerKey.from_file(b"sbd,P1.C1\n1,A\n", "key.csv")
+
+
+def test_plan_key_gives_full_marks_and_stats(docx_bytes):
+    template = tron_de.compile_docx_template(docx_bytes)
+    plan = tron_de.build_shuffle_plan(template, [101, 102, 103], "grade")
+    key = tron_de.AnswerKey.from_plan(plan)
+
+    table = plan.answer_table()
+    header = ["sbd", "ma_de"] + [f"P{part}.C{q + 1}" for part in sorted(table) for q in range(table[part].shape[1])]
+    lines = [",".join(header)]
+    for v, code in enumerate(plan.codes):
+        cells = [str(table[part][v, q]) for part in sorted(table) for q in range(table[part].shape[1])]
+        lines.append(",".join([f"HS{code}", str(code)] + [f'"{c}"' for c in cells]))
+    result = tron_de.grade_responses(key, tron_de.read_responses_csv("\n".join(lines).encode("utf-8")))
+
+    full = table[1].shape[1] * tron_de.MCQ_POINT + table[2].shape[1] * 1.0 + table[3].shape[1] * tron_de.SHORT_POINT
+    assert result["total"].tolist() == pytest.approx([full] * 3)
+    assert result["unknown"] == 0
+    assert all(row["Tỉ lệ đúng (%)"] == 100.0 and row["Số bài"] == 3 for row in result["stats"])
+
+
+def test_score_csv_lists_every_student():
+    key = tron_de.AnswerKey.from_file(KEY_CSV.encode("utf-8"), "DAPAN_THEO_MA_DE.csv")
+    text = b"".join(tron_de.score_csv_pieces(_grade(key))).decode("utf-8").splitlines()
+    assert text[0] == "sbd,ma_de,diem_p1,diem_p2,diem_p3,tong"
+    assert text[1] == "HS1,101,0.5,2.0,0.5,3.0"
+    assert len(text) == 1 + len(EXPECTED)
+
+
+def test_version_index_marks_unknown_codes():
+    key = tron_de.AnswerKey([103, 101, 102], {1: [["A"], ["B"], ["C"]]})
+    assert key.version_index(np.array([101, 104, 103, 0])).tolist() == [1, -1, 0, -1]
@@ -0,0 +1,67 @@
+"""Chép thẳng dữ liệu đã nén (write_raw_member) và đường dự phòng zout.writestr() cho cùng nội dung."""
+
+import io
+import zipfile
+
+import pytest
+
+import tron_de
+
+CODES = [101, 102]
+SEED = "raw"
+
+
+def _unzipped(docx_bytes):
+    """Từng thành phần: tên, CRC, kích thước, kiểu nén, thời gian, thuộc tính và nội dung giải nén."""
+    with zipfile.ZipFile(io.BytesIO(docx_bytes)) as z:
+        assert z.testzip() is None
+        return [
+            (info.filename, info.CRC, info.file_size, info.compress_type, info.date_time, info.external_attr,
+             z.read(info))
+            for info in z.infolist()
+        ]
+
+
+def _inner_docx(zip_bytes):
+    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as z:
+        return {name: _unzipped(z.read(name)) for name in z.namelist() if name.endswith(".docx")}
+
+
+@pytest.fixture
+def templates(docx_bytes, monkeypatch):
+    """(template chép nguyên khối, template ghi lại bằng writestr)."""
+    if not tron_de.RAW_MEMBER_COPY:
+        pytest.skip("Python này không bật chép nguyên khối")
+    fast = tron_de.compile_docx_template(docx_bytes)
+    assert any(raw is not None for _, _, raw in fast.members)
+    monkeypatch.setattr(tron_de, "RAW_MEMBER_COPY", False)
+    fallback = tron_de.compile_docx_template(docx_bytes)
+    assert all(raw is None for _, _, raw in fallback.members)
+    return fast, fallback
+
+
+def test_raw_copy_probe_matches_runtime():
+    assert tron_de.RAW_MEMBER_COPY == tron_de._probe_raw_member_copy()
+
+
+def test_raw_copy_matches_writestr_fallback(templates):
+    fast, fallback = templates
+    orders = tron_de.build_shuffle_plan(fast, CODES, SEED).version_orders(0)
+    assert _unzipped(fast.render(orders, ma_de=101)) == _unzipped(fallback.render(orders, ma_de=101))
+
+
+def test_raw_copy_matches_fallback_inside_batch_zip(templates):
+    fast, fallback = templates
+    plan = tron_de.build_shuffle_plan(fast, CODES, SEED)
+    assert _inner_docx(tron_de.build_batch_zip(fast, plan, "De", "full", SEED)) == \
+        _inner_docx(tron_de.build_batch_zip(fallback, plan, "De", "full", SEED))
+
+
+def test_probe_turns_off_outside_known_versions(monkeypatch):
+    monkeypatch.setattr(tron_de, "RAW_MEMBER_COPY_VERSIONS", ((3, 0), (3, 1)))
+    assert tron_de._probe_raw_member_copy() is False
+
+
+def test_probe_turns_off_when_internals_change(monkeypatch):
+    monkeypatch.setattr(tron_de, "_ZIPFILE_INTERNALS", tron_de._ZIPFILE_INTERNALS + ("_no_such_internal",))
+    assert tron_de._probe_raw_member_copy() is False
@@ -0,0 +1,22 @@
+"""Cache mã đề đã sinh: đúng mã đề được yêu cầu, lần sau lấy lại từ cache."""
+
+import tron_de
+
+CODES = [101, 102, 103, 104]
+SEED = "cache"
+
+
+def test_cached_render_versions_picks_the_right_versions(docx_bytes):
+    template = tron_de.compile_docx_template(docx_bytes)
+    plan = tron_de.build_shuffle_plan(template, CODES, SEED)
+    cache = tron_de.LRUByteCache(1 << 26)
+
+    rendered = tron_de.cached_render_versions(cache, template, plan, "full", SEED, codes=[104, 102])
+    assert sorted(rendered) == [102, 104]
+    for ma_de, data in rendered.items():
+        assert data == tron_de.render_version(template, ma_de, "full", SEED)[0]
+
+    assert tron_de.lookup_rendered_versions(cache, template, plan, "full", SEED) == rendered
+    again = tron_de.cached_render_versions(cache, template, plan, "full", SEED)
+    assert sorted(again) == CODES
+    assert all(again[ma_de] is rendered[ma_de] for ma_de in rendered)
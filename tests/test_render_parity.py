@@ -0,0 +1,46 @@
+"""Mọi đường sinh .docx (tuần tự, process pool, render_version, cache) cho cùng 1 dạng byte."""
+
+import io
+import zipfile
+
+import tron_de
+
+CODES = [101, 102, 103, 104]
+SEED = "42"
+
+
+def _inner_files(zip_bytes):
+    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as z:
+        return {name: z.read(name) for name in z.namelist() if name.endswith(".docx")}
+
+
+def test_serial_pool_and_render_version_are_byte_identical(docx_bytes):
+    template = tron_de.compile_docx_template(docx_bytes)
+    plan = tron_de.build_shuffle_plan(template, CODES, SEED)
+
+    serial = _inner_files(tron_de.build_batch_zip(template, plan, "De", "full", SEED, workers=1))
+    pool = _inner_files(tron_de.build_batch_zip(template, plan, "De", "full", SEED, workers=2))
+    assert serial == pool
+
+    for ma_de in CODES:
+        assert serial[f"De_V{ma_de}.docx"] == tron_de.render_version(template, ma_de, "full", SEED)[0]
+
+
+def test_cached_renders_match_streamed_entries(docx_bytes):
+    template = tron_de.compile_docx_template(docx_bytes)
+    plan = tron_de.build_shuffle_plan(template, CODES, SEED)
+    rendered = {CODES[1]: tron_de.render_version(template, CODES[1], "full", SEED)[0]}
+
+    mixed = _inner_files(tron_de.build_batch_zip(template, plan, "De", "full", SEED, rendered=rendered))
+    serial = _inner_files(tron_de.build_batch_zip(template, plan, "De", "full", SEED))
+    assert mixed == serial
+
+
+def test_render_to_file_matches_render(docx_bytes, tmp_path):
+    template = tron_de.compile_docx_template(docx_bytes)
+    orders = tron_de.build_shuffle_plan(template, [101], SEED).version_orders(0)
+
+    path = tmp_path / "V101.docx"
+    with open(path, "wb") as f:
+        template.render_to(f, orders, ma_de=101)
+    assert path.read_bytes() == template.render(orders, ma_de=101)
@@ -0,0 +1,57 @@
+"""Process pool sinh đề: chạy từ thread nền (như server Streamlit) và dừng giữa chừng."""
+
+import io
+import threading
+import zipfile
+
+import tron_de
+
+CODES = [101, 102, 103, 104, 105, 106]
+SEED = "7"
+
+
+def _entries(zip_bytes):
+    # so từng file theo tên: giờ ghi trong ZipInfo (độ phân giải 2 giây) khác nhau giữa 2 lần build;
+    # file .xlsx cũng là ZIP ghi giờ hiện tại -> so tiếp nội dung bên trong
+    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as z:
+        return {
+            name: _entries(z.read(name)) if name.endswith(".xlsx") else z.read(name)
+            for name in z.namelist()
+        }
+
+
+def test_pool_avoids_fork_off_the_main_thread():
+    assert tron_de.pool_start_method() in ("fork", "forkserver", "spawn")
+    seen = []
+    worker = threading.Thread(target=lambda: seen.append(tron_de.pool_start_method()))
+    worker.start()
+    worker.join()
+    assert seen[0] != "fork"
+
+
+def test_pool_from_background_thread_matches_serial(docx_bytes):
+    template = tron_de.compile_docx_template(docx_bytes)
+    plan = tron_de.build_shuffle_plan(template, CODES, SEED)
+    serial = tron_de.build_batch_zip(template, plan, "De", "full", SEED, workers=1)
+
+    result = {}
+
+    def run():
+        result["zip"] = tron_de.build_batch_zip(template, plan, "De", "full", SEED, workers=2)
+
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    worker.join(timeout=120)
+    assert not worker.is_alive()
+    assert _entries(result["zip"]) == _entries(serial)
+
+
+def test_closing_render_versions_early_cancels_pending(docx_bytes):
+    template = tron_de.compile_docx_template(docx_bytes)
+    plan = tron_de.build_shuffle_plan(template, CODES, SEED)
+    jobs = [(ma_de, "full", plan.version_orders(v)) for v, ma_de in enumerate(CODES)]
+
+    results = tron_de.render_versions(template, jobs, workers=2)
+    first = next(results)
+    results.close()
+    assert first == tron_de.render_version(template, CODES[0], "full", SEED)[0]
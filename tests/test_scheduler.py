@@ -0,0 +1,70 @@
+"""Hàng đợi chung: sinh từng mã đề ngay trong phiên (run_now) cũng bị giới hạn tiến trình / RAM."""
+
+import threading
+
+import pytest
+
+import tron_de
+
+
+@pytest.fixture(scope="module")
+def template(docx_bytes):
+    return tron_de.compile_docx_template(docx_bytes)
+
+
+def _hold(scheduler, template, release):
+    """Giữ 1 chỗ trong scheduler trên thread khác cho tới khi `release` được set."""
+    entered = threading.Event()
+
+    def render():
+        entered.set()
+        release.wait(10)
+
+    worker = threading.Thread(target=scheduler.run_now, args=(template, render), daemon=True)
+    worker.start()
+    assert entered.wait(10)
+    return worker
+
+
+def test_run_now_waits_for_a_free_worker(template):
+    scheduler = tron_de.BatchScheduler(1, 1 << 30, 4)
+    release = threading.Event()
+    holder = _hold(scheduler, template, release)
+    assert scheduler.stats()["running"] == 1
+
+    done = []
+    waiter = threading.Thread(target=lambda: done.append(scheduler.run_now(template, lambda: "ok")), daemon=True)
+    waiter.start()
+    waiter.join(0.3)
+    assert not done and scheduler.stats()["queued"] == 1
+
+    release.set()
+    holder.join(10)
+    waiter.join(10)
+    assert done == ["ok"]
+    assert scheduler.stats() == {"running": 0, "queued": 0, "workers": 0, "memory": 0}
+
+
+def test_run_now_times_out_and_leaves_the_queue(template):
+    scheduler = tron_de.BatchScheduler(1, 1 << 30, 4)
+    release = threading.Event()
+    holder = _hold(scheduler, template, release)
+    with pytest.raises(Exception, match="bận"):
+        scheduler.run_now(template, lambda: "never", timeout=0.1)
+    assert scheduler.stats()["queued"] == 0
+    release.set()
+    holder.join(10)
+
+
+def test_run_now_respects_full_queue_and_memory_budget(template):
+    scheduler = tron_de.BatchScheduler(1, 1 << 30, 0)
+    release = threading.Event()
+    holder = _hold(scheduler, template, release)
+    with pytest.raises(Exception, match="quá tải"):
+        scheduler.run_now(template, lambda: "never")
+    release.set()
+    holder.join(10)
+
+    tiny = tron_de.BatchScheduler(1, 1, 4)
+    with pytest.raises(Exception, match="quá lớn"):
+        tiny.run_now(template, lambda: "never")
@@ -0,0 +1,28 @@
+"""collect_text_runs giữ đúng thứ tự w:t trong tài liệu, kể cả khi run chứa text box."""
+
+import pytest
+
+import tron_de
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+PARAGRAPH = (
+    f'<w:document xmlns:w="{W_NS}" xmlns:v="urn:schemas-microsoft-com:vml"><w:body><w:p>'
+    '<w:r><w:t>A.</w:t><w:pict><v:shape><v:textbox><w:txbxContent>'
+    '<w:p><w:r><w:t>hộp</w:t></w:r></w:p>'
+    '</w:txbxContent></v:textbox></v:shape></w:pict><w:t xml:space="preserve"> sau</w:t></w:r>'
+    '<w:r><w:t xml:space="preserve"> cuối</w:t></w:r>'
+    '</w:p></w:body></w:document>'
+).encode("utf-8")
+
+
+@pytest.mark.parametrize("backend", ["minidom", "etree"])
+def test_text_pairs_follow_document_order(backend):
+    xd = tron_de.open_xml(PARAGRAPH, backend)
+    block = xd.descendants(xd.root, "p")[0]
+    runs, texts = tron_de.collect_text_runs(xd, block)
+
+    assert [xd.text(t) for t, _ in texts] == ["A.", "hộp", " sau", " cuối"]
+    outer, inner, last = runs
+    assert [r for _, r in texts] == [outer, inner, outer, last]
+    assert tron_de.get_text(xd, texts) == "A.hộp sau cuối"
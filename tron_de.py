@@ -0,0 +1,2853 @@
+"""
+Trộn Đề Word - lõi xử lý (không phụ thuộc Streamlit)
+
+Dùng chung cho giao diện web (app.py) và chạy lô bằng dòng lệnh:
+
+    python -m tron_de De_goc.docx [De_khac.docx ...] -n 24 --start 101 --seed 123456789 --workers 4 -o ket_qua/
+
+Mỗi file .docx -> ket_qua/<tên>_multi.zip gồm các mã đề, file đáp án (--answers) và SEED.txt.
+Import module này không vẽ giao diện, không đọc/ghi gì ngoài các hàm được gọi.
+"""
+
+import re
+import bisect
+import random
+import zipfile
+import io
+import os
+import sys
+import hashlib
+import secrets
+import csv
+import json
+import struct
+import marshal
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+
+# ==================== XML BACKEND (MINIDOM / ELEMENTTREE) ====================
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+XML_NS = "http://www.w3.org/XML/1998/namespace"
+_W = "{%s}" % W_NS
+
+
+def _xml_escape(data: str) -> str:
+    """Escape giống minidom (_write_data) cho cả text lẫn giá trị thuộc tính."""
+    if "&" in data:
+        data = data.replace("&", "&amp;")
+    if "<" in data:
+        data = data.replace("<", "&lt;")
+    if '"' in data:
+        data = data.replace('"', "&quot;")
+    if ">" in data:
+        data = data.replace(">", "&gt;")
+    return data
+
+
+class MinidomXml:
+    """
+    1 file XML trên xml.dom.minidom — bản tham chiếu (chậm, tốn RAM).
+    Các bước biên dịch chỉ đụng tới cây XML qua các hàm của adapter này (và EtreeXml).
+    """
+
+    name = "minidom"
+
+    def __init__(self, data):
+        from xml.dom import minidom  # chỉ nạp khi thật sự dùng backend tham chiếu
+        self.dom = minidom.parseString(data)
+        self.root = self.dom.documentElement
+
+    def w_local(self, node):
+        """localName nếu là phần tử w:*, ngược lại None."""
+        if node.nodeType == node.ELEMENT_NODE and node.namespaceURI == W_NS:
+            return node.localName
+        return None
+
+    def elements(self, node):
+        return [c for c in node.childNodes if c.nodeType == c.ELEMENT_NODE]
+
+    def siblings(self, node):
+        """Các nút con; None thay cho nút không phải phần tử (text, comment...)."""
+        return [c if c.nodeType == c.ELEMENT_NODE else None for c in node.childNodes]
+
+    def descendants(self, node, local):
+        return node.getElementsByTagNameNS(W_NS, local)
+
+    def child(self, node, local):
+        for c in node.childNodes:
+            if c.nodeType == c.ELEMENT_NODE and c.namespaceURI == W_NS and c.localName == local:
+                return c
+        return None
+
+    def children(self, node, local):
+        return [
+            c for c in node.childNodes
+            if c.nodeType == c.ELEMENT_NODE and c.namespaceURI == W_NS and c.localName == local
+        ]
+
+    def first(self, node, local):
+        found = node.getElementsByTagNameNS(W_NS, local)
+        return found[0] if found else None
+
+    def parent(self, node):
+        return node.parentNode
+
+    def text(self, t):
+        return t.firstChild.nodeValue if t.firstChild is not None else None
+
+    def set_text(self, t, text):
+        if t.firstChild is None:
+            t.appendChild(self.dom.createTextNode(text))
+        else:
+            t.firstChild.nodeValue = text
+
+    def get_w_attr(self, node, local):
+        return node.getAttributeNS(W_NS, local) or node.getAttribute("w:" + local) or ""
+
+    def set_w_attr(self, node, local, value):
+        node.setAttributeNS(W_NS, "w:" + local, value)
+
+    def preserve_space(self, t):
+        t.setAttributeNS(XML_NS, "xml:space", "preserve")
+
+    def create_w(self, parent, local, first=False):
+        el = self.dom.createElementNS(W_NS, "w:" + local)
+        if first:
+            parent.insertBefore(el, parent.firstChild)
+        else:
+            parent.appendChild(el)
+        return el
+
+    def append(self, parent, child):
+        parent.appendChild(child)
+
+    def remove(self, node):
+        node.parentNode.removeChild(node)
+        node.unlink()
+
+    def count_nodes(self, node):
+        return 1 + sum(self.count_nodes(child) for child in node.childNodes)
+
+    def replace_children(self, node, text, children):
+        for child in list(node.childNodes):
+            node.removeChild(child)
+        node.appendChild(self.dom.createTextNode(text))
+        for child in children:
+            node.appendChild(child)
+
+    def serialize(self, node) -> bytes:
+        return node.toxml().encode("utf-8")
+
+    def serialize_document(self) -> bytes:
+        return self.dom.toxml().encode("utf-8")
+
+
+class EtreeXml:
+    """
+    1 file XML trên xml.etree (parser C): parse nhanh, ít RAM hơn minidom nhiều lần.
+    Tự serialize đúng định dạng toxml() của minidom (giữ prefix, khai báo xmlns tại chỗ)
+    -> kết quả giống từng byte với MinidomXml (xem tests/test_xml_backends.py).
+    Comment/PI trong XML hoặc 1 namespace dùng nhiều prefix -> ValueError (dùng minidom).
+    """
+
+    name = "etree"
+
+    def __init__(self, data):
+        if b"<!--" in data or data.count(b"<?") > 1:
+            raise ValueError("XML có comment/processing instruction")
+
+        self.decls = {}            # phần tử -> [(prefix, uri)] khai báo ngay trên phần tử đó
+        self.prefixes = {XML_NS: "xml"}
+        bound = {"xml": XML_NS}
+        self._qnames = {}
+        self._parents = None
+
+        parser = ET.XMLPullParser(events=("start-ns", "start"))
+        parser.feed(data)
+        parser.close()
+        root = None
+        pending = []
+        for event, obj in parser.read_events():
+            if event == "start-ns":
+                prefix, uri = obj
+                if bound.setdefault(prefix, uri) != uri or self.prefixes.setdefault(uri, prefix) != prefix:
+                    raise ValueError("namespace dùng nhiều prefix")
+                pending.append(obj)
+            else:
+                if root is None:
+                    root = obj
+                if pending:
+                    self.decls[obj] = pending
+                    pending = []
+        self.root = root
+
+    def _qname(self, tag):
+        q = self._qnames.get(tag)
+        if q is None:
+            if tag[0] == "{":
+                uri, local = tag[1:].split("}", 1)
+                prefix = self.prefixes[uri]
+                q = prefix + ":" + local if prefix else local
+            else:
+                q = tag
+            self._qnames[tag] = q
+        return q
+
+    def w_local(self, node):
+        tag = node.tag
+        return tag[len(_W):] if tag.startswith(_W) else None
+
+    def elements(self, node):
+        return list(node)
+
+    def siblings(self, node):
+        out = [None] if node.text is not None else []
+        for child in node:
+            out.append(child)
+            if child.tail is not None:
+                out.append(None)
+        return out
+
+    def descendants(self, node, local):
+        return [e for e in node.iter(_W + local) if e is not node]
+
+    def child(self, node, local):
+        return node.find(_W + local)
+
+    def children(self, node, local):
+        return node.findall(_W + local)
+
+    def first(self, node, local):
+        for e in node.iter(_W + local):
+            if e is not node:
+                return e
+        return None
+
+    def parent(self, node):
+        if self._parents is None:
+            self._parents = {child: p for p in self.root.iter() for child in p}
+        return self._parents.get(node)
+
+    def text(self, t):
+        return t.text
+
+    def set_text(self, t, text):
+        t.text = text
+
+    def get_w_attr(self, node, local):
+        return node.get(_W + local) or ""
+
+    def set_w_attr(self, node, local, value):
+        node.set(_W + local, value)
+
+    def preserve_space(self, t):
+        t.set("{%s}space" % XML_NS, "preserve")
+
+    def create_w(self, parent, local, first=False):
+        el = ET.Element(_W + local)
+        if first:
+            parent.insert(0, el)
+        else:
+            parent.append(el)
+        if self._parents is not None:
+            self._parents[el] = parent
+        return el
+
+    def append(self, parent, child):
+        old = self.parent(child)
+        if old is not None:
+            old.remove(child)
+        parent.append(child)
+        self._parents[child] = parent
+
+    def remove(self, node):
+        parent = self.parent(node)
+        parent.remove(node)
+        del self._parents[node]
+
+    def count_nodes(self, node):
+        total = 1 + (node.text is not None)
+        for child in node:
+            total += self.count_nodes(child) + (child.tail is not None)
+        return total
+
+    def replace_children(self, node, text, children):
+        node[:] = list(children)
+        node.text = text
+        for child in children:
+            child.tail = None
+
+    def _write(self, node, write):
+        tag = self._qname(node.tag)
+        write("<" + tag)
+        for prefix, uri in self.decls.get(node, ()):
+            write(' xmlns%s="%s"' % (":" + prefix if prefix else "", _xml_escape(uri)))
+        for key, value in node.attrib.items():
+            write(' %s="%s"' % (self._qname(key), _xml_escape(value)))
+        if node.text is not None or len(node):
+            write(">")
+            if node.text:
+                write(_xml_escape(node.text))
+            for child in node:
+                self._write(child, write)
+                if child.tail:
+                    write(_xml_escape(child.tail))
+            write("</" + tag + ">")
+        else:
+            write("/>")
+
+    def serialize(self, node) -> bytes:
+        out = []
+        self._write(node, out.append)
+        return "".join(out).encode("utf-8")
+
+    def serialize_document(self) -> bytes:
+        return b'<?xml version="1.0" ?>' + self.serialize(self.root)
+
+
+XML_BACKENDS = {"minidom": MinidomXml, "etree": EtreeXml}
+DEFAULT_XML_BACKEND = os.environ.get("TRON_DE_XML_BACKEND", "etree")
+
+
+def open_xml(data: bytes, backend=None):
+    """Parse XML bằng backend chọn (mặc định TRON_DE_XML_BACKEND); etree không đọc được thì về minidom."""
+    name = backend or DEFAULT_XML_BACKEND
+    if name not in XML_BACKENDS:
+        raise Exception(f"Không có XML backend '{name}' (chọn: {', '.join(XML_BACKENDS)})")
+    if name == "etree":
+        try:
+            return EtreeXml(data)
+        except ValueError:
+            return MinidomXml(data)
+    return XML_BACKENDS[name](data)
+
+
+# ==================== WORD XML HELPERS ====================
+
+def shuffle_array(arr, rng=None):
+    rng = rng or random
+    out = arr.copy()
+    for i in range(len(out) - 1, 0, -1):
+        j = rng.randint(0, i)
+        out[i], out[j] = out[j], out[i]
+    return out
+
+
+# Mẫu nhãn (biên dịch 1 lần)
+LABEL_ONLY_RE = re.compile(r"[A-D][\.\)]|[a-d]\)|(?i:Câu\s*\d+\.)")
+MCQ_LABEL_RE = re.compile(r"^(\s*)([A-D])([\.\)])?", re.IGNORECASE)
+TF_LABEL_RE = re.compile(r"^(\s*)([a-d])(\))?", re.IGNORECASE)
+QUESTION_LABEL_RE = re.compile(r"^(\s*)(Câu\s*)(\d+)(\.)?", re.IGNORECASE)
+MCQ_PUNCT_RE = re.compile(r"^[\.\)]")
+TF_PUNCT_RE = re.compile(r"^\)")
+BLANK_RE = re.compile(r"^\s*$")
+NUMBER_TAIL_RE = re.compile(r"^[\s0-9\.]*$")
+
+
+def collect_text_runs(xd, block):
+    """
+    Ghi lại 1 lần khi biên dịch: các w:r của block và cặp (w:t, w:r) theo thứ tự.
+    Các bước sau (đọc text, gạch chân, đánh nhãn, tô màu) chỉ truy cập con trực tiếp.
+    """
+    runs = xd.descendants(block, "r")
+    owner = {id(t): r for r in runs for t in xd.children(r, "t")}
+    # duyệt w:t theo đúng thứ tự trong tài liệu: text box nằm giữa run được xếp trước w:t đứng sau nó
+    return runs, [(t, owner[id(t)]) for t in xd.descendants(block, "t") if id(t) in owner]
+
+
+def get_text(xd, texts):
+    return "".join(xd.text(t) or "" for t, _ in texts).strip()
+
+
+def _run_text(xd, run):
+    return "".join(xd.text(t) or "" for t in xd.children(run, "t"))
+
+
+def _is_label_only_text(s: str) -> bool:
+    return LABEL_ONLY_RE.fullmatch((s or "").strip()) is not None
+
+
+def run_has_underline(xd, run) -> bool:
+    rPr = xd.child(run, "rPr")
+    if rPr is None:
+        return False
+    u_el = xd.child(rPr, "u")
+    if u_el is None:
+        return False
+    val = (xd.get_w_attr(u_el, "val") or "").strip().lower()
+    if val == "none":
+        return False
+    return True
+
+
+def block_has_underlined_content(xd, runs) -> bool:
+    for r in runs:
+        if not run_has_underline(xd, r):
+            continue
+        rt = _run_text(xd, r)
+        if _is_label_only_text(rt):
+            continue
+        if (rt or "").strip():
+            return True
+    return False
+
+
+def remove_underline_in_block(xd, runs):
+    """Bỏ gạch chân trong 1 block (danh sách run đã ghi lại) để đề trộn không lộ đáp án."""
+    for r in runs:
+        rPr = xd.child(r, "rPr")
+        if rPr is None:
+            continue
+        for u in xd.children(rPr, "u"):
+            xd.set_w_attr(u, "val", "none")
+
+
+def remove_short_answer_lines(group):
+    """Bỏ các block dạng 'Đáp án: ...' khỏi 1 câu PHẦN 3 trong đề trộn."""
+    answer_lines = set(group.answer_lines)
+    return [i for i in group.blocks if i not in answer_lines]
+
+
+def style_run_blue_bold(xd, run):
+    """Tô xanh + đậm cho nhãn (chỉ để đẹp đề)."""
+    rPr = xd.child(run, "rPr")
+    if rPr is None:
+        rPr = xd.create_w(run, "rPr", first=True)
+
+    color_el = xd.child(rPr, "color")
+    if color_el is None:
+        color_el = xd.create_w(rPr, "color")
+    xd.set_w_attr(color_el, "val", "0000FF")
+
+    if xd.child(rPr, "b") is None:
+        xd.create_w(rPr, "b")
+
+
+def update_mcq_label(xd, texts, new_label):
+    """texts: [(w:t, w:r)] của đoạn (collect_text_runs)."""
+    new_letter = new_label[0].upper()
+    new_punct = "."
+
+    for i, (t, run) in enumerate(texts):
+        txt = xd.text(t)
+        if not txt:
+            continue
+
+        m = MCQ_LABEL_RE.match(txt)
+        if not m:
+            continue
+
+        leading_space = m.group(1) or ""
+        old_punct = m.group(3) or ""
+        after_match = txt[m.end():]
+
+        if old_punct:
+            xd.set_text(t, leading_space + new_letter + new_punct + after_match)
+        else:
+            xd.set_text(t, leading_space + new_letter + after_match)
+            found_punct = False
+            for t2, _ in texts[i + 1:]:
+                txt2 = xd.text(t2)
+                if not txt2:
+                    continue
+                if MCQ_PUNCT_RE.match(txt2):
+                    xd.set_text(t2, new_punct + txt2[1:])
+                    found_punct = True
+                    break
+                elif BLANK_RE.match(txt2):
+                    continue
+                else:
+                    break
+            if not found_punct:
+                xd.set_text(t, leading_space + new_letter + new_punct + after_match)
+
+        style_run_blue_bold(xd, run)
+        break
+
+
+def update_tf_label(xd, texts, new_label):
+    new_letter = new_label[0].lower()
+    new_punct = ")"
+
+    for i, (t, run) in enumerate(texts):
+        txt = xd.text(t)
+        if not txt:
+            continue
+
+        m = TF_LABEL_RE.match(txt)
+        if not m:
+            continue
+
+        leading_space = m.group(1) or ""
+        old_punct = m.group(3) or ""
+        after_match = txt[m.end():]
+
+        if old_punct:
+            xd.set_text(t, leading_space + new_letter + new_punct + after_match)
+        else:
+            xd.set_text(t, leading_space + new_letter + after_match)
+            found_punct = False
+            for t2, _ in texts[i + 1:]:
+                txt2 = xd.text(t2)
+                if not txt2:
+                    continue
+                if TF_PUNCT_RE.match(txt2):
+                    found_punct = True
+                    break
+                elif BLANK_RE.match(txt2):
+                    continue
+                else:
+                    break
+            if not found_punct:
+                xd.set_text(t, leading_space + new_letter + new_punct + after_match)
+
+        style_run_blue_bold(xd, run)
+        break
+
+
+def update_question_label(xd, texts, new_label):
+    for i, (t, run) in enumerate(texts):
+        txt = xd.text(t)
+        if not txt:
+            continue
+
+        m = QUESTION_LABEL_RE.match(txt)
+        if not m:
+            continue
+
+        leading_space = m.group(1) or ""
+        after_match = txt[m.end():]
+
+        xd.set_text(t, leading_space + new_label + after_match)
+        style_run_blue_bold(xd, run)
+
+        for t2, _ in texts[i + 1:]:
+            txt2 = xd.text(t2)
+            if not txt2:
+                continue
+            if NUMBER_TAIL_RE.match(txt2) and txt2.strip():
+                xd.set_text(t2, "")
+            elif BLANK_RE.match(txt2):
+                continue
+            else:
+                break
+        break
+
+
+# ==================== BLOCK INDEX (QUÉT DOM 1 LẦN) ====================
+
+PART_HEADER_RE = re.compile(r"^PHẦN\s*\d\b", re.IGNORECASE)
+PART_REF_RE = re.compile(r"PHẦN\s*([1-3])\b", re.IGNORECASE)
+QUESTION_START_RE = re.compile(r"^Câu\s*\d+\b")
+MCQ_OPTION_RE = re.compile(r"^\s*[A-D][\.\)]", re.IGNORECASE)
+TF_OPTION_RE = re.compile(r"^\s*([a-d])\)", re.IGNORECASE)
+ANSWER_LINE_RE = re.compile(r"^\s*Đáp\s*án\s*[:\-]\s*(.+)\s*$", re.IGNORECASE)
+
+
+class BlockInfo:
+    """
+    Thông tin 1 block (w:p / w:tbl) của w:body, tính đúng 1 lần khi biên dịch.
+    kind: "part_header" | "question" | "answer" | "tf_option" | "mcq_option" | "other"
+    Các cờ mcq / tf_letter giữ riêng vì "a)" vừa là phương án PHẦN 2 vừa khớp mẫu A-D của PHẦN 1.
+    part_refs: các số PHẦN 1/2/3 được nhắc tới trong block (để tìm tiêu đề phần).
+    runs / texts: w:r và (w:t, w:r) của block, ghi lại để đánh nhãn / bỏ gạch chân không phải tìm lại.
+    """
+
+    __slots__ = ("node", "runs", "texts", "text", "kind", "part_refs", "mcq", "tf_letter", "answer", "underlined")
+
+    def __init__(self, xd, node):
+        self.node = node
+        self.runs, self.texts = collect_text_runs(xd, node)
+        self.text = text = get_text(xd, self.texts)
+
+        self.part_refs = tuple(int(n) for n in PART_REF_RE.findall(text)) if "HẦN" in text.upper() else ()
+        self.mcq = MCQ_OPTION_RE.match(text) is not None
+        m = TF_OPTION_RE.match(text)
+        self.tf_letter = m.group(1).lower() if m else ""
+        m = ANSWER_LINE_RE.match(text)
+        self.answer = (m.group(1) or "").strip() if m else None
+
+        if PART_HEADER_RE.match(text):
+            self.kind = "part_header"
+        elif QUESTION_START_RE.match(text):
+            self.kind = "question"
+        elif self.answer is not None:
+            self.kind = "answer"
+        elif self.tf_letter:
+            self.kind = "tf_option"
+        elif self.mcq:
+            self.kind = "mcq_option"
+        else:
+            self.kind = "other"
+
+        # gạch chân chỉ có nghĩa với phương án -> chỉ duyệt run của các block đó
+        self.underlined = (self.mcq or bool(self.tf_letter)) and block_has_underlined_content(xd, self.runs)
+
+
+def build_block_index(xd, blocks):
+    return [BlockInfo(xd, b) for b in blocks]
+
+
+# ==================== TOKENIZER: PHẦN / CÂU (1 LƯỢT) ====================
+
+class QuestionGroup:
+    """1 câu hỏi: các block liên tiếp từ dòng 'Câu N' tới trước câu/phần tiếp theo."""
+
+    __slots__ = ("blocks", "mcq_options", "tf_options", "answer_lines")
+
+    def __init__(self, start):
+        self.blocks = [start]
+        self.mcq_options = []   # chỉ số block khớp mẫu A. / B) ...
+        self.tf_options = []    # chỉ số block khớp mẫu a) b) ...
+        self.answer_lines = []  # chỉ số block 'Đáp án: ...'
+
+    def add(self, i, info):
+        self.blocks.append(i)
+        if info.mcq:
+            self.mcq_options.append(i)
+        if info.tf_letter:
+            self.tf_options.append(i)
+        if info.answer is not None:
+            self.answer_lines.append(i)
+
+
+class PartSection:
+    """1 phần: tiêu đề PHẦN n, các block giới thiệu và các câu hỏi."""
+
+    __slots__ = ("number", "header", "intro", "questions")
+
+    def __init__(self, number, header):
+        self.number = number
+        self.header = header
+        self.intro = []
+        self.questions = []
+
+
+class DocumentStructure:
+    """Cấu trúc đề: block trước phần đầu tiên + các PHẦN theo thứ tự xuất hiện."""
+
+    __slots__ = ("preamble", "parts")
+
+    def __init__(self):
+        self.preamble = []
+        self.parts = []
+
+
+def tokenize_body(index):
+    """
+    Chia block thành PHẦN / giới thiệu / câu hỏi trong đúng 1 lượt.
+    - Tiêu đề PHẦN n = block đầu tiên nhắc tới 'PHẦN n' (n chưa gặp)
+    - Câu hỏi bắt đầu ở 'Câu N', kéo dài tới câu sau hoặc dòng 'PHẦN x' kế tiếp
+    - Block không thuộc câu nào được đưa vào phần giới thiệu của phần đó
+    """
+    structure = DocumentStructure()
+    seen = set()
+    section = None
+    group = None
+
+    for i, info in enumerate(index):
+        new_parts = [n for n in info.part_refs if n not in seen]
+        if new_parts:
+            number = min(new_parts)
+            seen.add(number)
+            section = PartSection(number, i)
+            structure.parts.append(section)
+            group = None
+            continue
+
+        if section is None:
+            structure.preamble.append(i)
+        elif info.kind == "question":
+            group = QuestionGroup(i)
+            section.questions.append(group)
+        elif group is not None and info.kind != "part_header":
+            group.add(i, info)
+        else:
+            group = None
+            section.intro.append(i)
+
+    return structure
+
+
+# ==================== PLACEHOLDER MA_DE (WITH MODE) ====================
+
+# Token hỗ trợ (quét 1 lượt, thứ tự ưu tiên giống thay lần lượt {{...}} rồi {...}):
+# - {{MA_DE}} / {MA_DE}: theo mode (full | 2dau | 2cuoi)
+# - {{MA_DE_2DAU}} / {MA_DE_2DAU}: luôn 2 số đầu
+# - {{MA_DE_2CUOI}} / {MA_DE_2CUOI}: luôn 2 số cuối (giữ 0 nếu có)
+MA_DE_TOKEN_RE = re.compile(rb"\{\{MA_DE(?:_2DAU|_2CUOI)?\}\}|\{MA_DE(?:_2DAU|_2CUOI)?\}")
+MA_DE_TEXT_RE = re.compile(MA_DE_TOKEN_RE.pattern.decode("ascii"))
+
+
+def placeholder_values(ma_de: int, ma_de_mode: str = "full"):
+    """{token bytes: giá trị bytes} cho 1 mã đề."""
+    code3 = f"{int(ma_de):03d}"  # luôn 3 chữ số
+    first2 = code3[:2]
+    last2 = code3[-2:]
+
+    if ma_de_mode == "2dau":
+        main_value = first2
+    elif ma_de_mode == "2cuoi":
+        main_value = last2
+    else:
+        main_value = code3
+
+    values = {}
+    for suffix, value in (("", main_value), ("_2DAU", first2), ("_2CUOI", last2)):
+        values[b"{{MA_DE%s}}" % suffix.encode()] = value.encode("utf-8")
+        values[b"{MA_DE%s}" % suffix.encode()] = value.encode("utf-8")
+    return values
+
+
+def replace_ma_de_placeholders(xml_text, ma_de: int, ma_de_mode: str = "full"):
+    """Thay mọi token mã đề trong 1 lượt quét. Nhận str hoặc bytes UTF-8, trả về cùng kiểu."""
+    values = placeholder_values(ma_de, ma_de_mode)
+    if isinstance(xml_text, bytes):
+        return MA_DE_TOKEN_RE.sub(lambda m: values[m.group(0)], xml_text)
+    return MA_DE_TOKEN_RE.sub(lambda m: values[m.group(0)], xml_text.encode("utf-8")).decode("utf-8")
+
+
+def compile_placeholders(data: bytes):
+    """
+    Quét `data` 1 lần, tách tại các token mã đề.
+    Không có token -> trả lại nguyên bytes; có -> (các đoạn tĩnh, các token) để mỗi mã đề chỉ việc ghép.
+    """
+    pieces = []
+    tokens = []
+    pos = 0
+    for m in MA_DE_TOKEN_RE.finditer(data):
+        pieces.append(data[pos:m.start()])
+        tokens.append(m.group(0))
+        pos = m.end()
+    if not tokens:
+        return data
+    pieces.append(data[pos:])
+    return (tuple(pieces), tuple(tokens))
+
+
+def fill_placeholders(compiled, values=None) -> bytes:
+    """Ghép kết quả compile_placeholders với giá trị của 1 mã đề (values=None -> giữ nguyên token)."""
+    if isinstance(compiled, bytes):
+        return compiled
+    pieces, tokens = compiled
+    out = [pieces[0]]
+    for token, piece in zip(tokens, pieces[1:]):
+        out.append(token if values is None else values[token])
+        out.append(piece)
+    return b"".join(out)
+
+
+def placeholder_nbytes(compiled) -> int:
+    if isinstance(compiled, bytes):
+        return len(compiled)
+    return sum(len(p) for p in compiled[0]) + sum(len(t) for t in compiled[1])
+
+
+def _enclosing_paragraph(xd, node):
+    node = xd.parent(node)
+    while node is not None and xd.w_local(node) != "p":
+        node = xd.parent(node)
+    return node
+
+
+def merge_split_placeholders(xd, root) -> int:
+    """
+    Word hay cắt {{MA_DE}} thành nhiều run ("{{MA_" + "DE}}") -> gom token về w:t chứa ký tự đầu.
+    Ghép text các w:t theo từng đoạn (kể cả đoạn trong TextBox), tìm token 1 lượt. Trả về số token đã gom.
+    """
+    t_nodes = [t for t in xd.descendants(root, "t") if xd.text(t) is not None]
+    if not any("{" in xd.text(t) for t in t_nodes):
+        return 0
+
+    groups = OrderedDict()
+    for t in t_nodes:
+        groups.setdefault(id(_enclosing_paragraph(xd, t)), []).append(t)
+
+    merged = 0
+    for t_nodes in groups.values():
+        texts = [xd.text(t) or "" for t in t_nodes]
+        joined = "".join(texts)
+        if "{" not in joined:
+            continue
+        starts = []
+        pos = 0
+        for text in texts:
+            starts.append(pos)
+            pos += len(text)
+
+        # xử lý từ cuối lên: sửa token sau không làm lệch vị trí token trước
+        for m in reversed(list(MA_DE_TEXT_RE.finditer(joined))):
+            first = bisect.bisect_right(starts, m.start()) - 1
+            last = bisect.bisect_left(starts, m.end()) - 1
+            if first == last:
+                continue
+            texts[first] = texts[first][:m.start() - starts[first]] + m.group(0)
+            for k in range(first + 1, last):
+                texts[k] = ""
+            texts[last] = texts[last][m.end() - starts[last]:]
+            for k in range(first, last + 1):
+                _set_t_text(xd, t_nodes[k], texts[k])
+            merged += 1
+    return merged
+
+
+def prepare_placeholder_part(data: bytes, backend=None):
+    """header/footer/footnotes/endnotes: gom token bị cắt (nếu có) rồi compile_placeholders."""
+    if b"{" in data:
+        try:
+            xd = open_xml(data, backend)
+            if merge_split_placeholders(xd, xd.root):
+                data = xd.serialize_document()
+        except Exception:
+            pass
+    return compile_placeholders(data)
+
+
+# ==================== PART 1: MCQ ====================
+
+def compile_mcq_question(xd, index, group):
+    """
+    Phân tích 1 câu PHẦN 1 (QuestionGroup) -> spec dùng lại cho mọi mã đề.
+    Đáp án đúng đọc từ gạch chân rồi bỏ gạch chân ngay trên template.
+    """
+    options = group.mcq_options
+
+    if len(options) < 2:
+        return {"head": list(group.blocks), "options": [], "fixed": [], "tail": [], "shuffle": False, "answer": ""}
+
+    letters = []
+    correct_old = ""
+    for i in options:
+        info = index[i]
+        old_letter = info.text[0].upper() if info.text else ""
+        if info.underlined:
+            correct_old = old_letter
+        letters.append(old_letter)
+        remove_underline_in_block(xd, info.runs)
+
+    return {
+        "head": [i for i in group.blocks if i < options[0]],
+        "options": list(options),
+        "fixed": [],
+        "tail": [i for i in group.blocks if i > options[-1]],
+        "shuffle": True,
+        "letters": letters,
+        "correct": correct_old,
+        "answer": None,
+    }
+
+
+# ==================== PART 2: TRUE/FALSE ====================
+
+def compile_tf_question(xd, index, group):
+    """Phân tích 1 câu PHẦN 2: a,b,c được trộn, d giữ cuối; gạch chân = Đ."""
+    option_map = {}
+    for i in group.tf_options:
+        option_map[index[i].tf_letter] = (i, index[i].underlined)
+
+    for i, _ in option_map.values():
+        remove_underline_in_block(xd, index[i].runs)
+
+    if len(option_map) < 2:
+        key_labels = []
+        for k in ["a", "b", "c", "d"]:
+            if k in option_map:
+                key_labels.append("Đ" if option_map[k][1] else "S")
+        return {"head": list(group.blocks), "options": [], "fixed": [], "tail": [], "shuffle": False,
+                "answer": "".join(key_labels)}
+
+    abc = [option_map[k] for k in ["a", "b", "c"] if k in option_map]
+    fixed = [option_map["d"]] if "d" in option_map else []
+    truths = [t for _, t in abc]
+    fixed_truths = [t for _, t in fixed]
+
+    min_idx = min(i for i, _ in option_map.values())
+    max_idx = max(i for i, _ in option_map.values())
+    return {
+        "head": [i for i in group.blocks if i < min_idx],
+        "options": [i for i, _ in abc],
+        "truths": truths,
+        "fixed": [i for i, _ in fixed],
+        "fixed_truths": fixed_truths,
+        "tail": [i for i in group.blocks if i > max_idx],
+        "shuffle": len(abc) >= 2,
+        "answer": None if len(abc) >= 2 else tf_key_string(truths + fixed_truths),
+    }
+
+
+def tf_key_string(truths) -> str:
+    return "".join(("Đ" if t else "S") for t in truths[:4])
+
+
+# ==================== PART 3: SHORT ANSWER ====================
+
+def extract_short_answer_from_question(index, group) -> str:
+    if group.answer_lines:
+        return index[group.answer_lines[0]].answer
+    return ""
+
+
+def compile_short_answer_question(index, group):
+    """Phân tích 1 câu PHẦN 3: lấy 'Đáp án: ...' và bỏ dòng đó khỏi đề trộn."""
+    return {
+        "head": remove_short_answer_lines(group),
+        "options": [],
+        "fixed": [],
+        "tail": [],
+        "shuffle": False,
+        "answer": extract_short_answer_from_question(index, group),
+    }
+
+
+def question_layout(q, option_order=None):
+    """Thứ tự block của 1 câu theo hoán vị phương án (None = giữ nguyên)."""
+    options = q["options"]
+    if option_order is not None:
+        options = [options[k] for k in option_order]
+    return q["head"] + options + q["fixed"] + q["tail"]
+
+
+def process_part(intro, questions, roles, question_order, option_orders):
+    """
+    Dựng 1 phần theo hoán vị đã có -> [(block_idx, nhãn mới hoặc None)].
+    Nhãn Câu N. / A. / a) được đánh lại theo vị trí sau khi trộn.
+    """
+    result = [(i, None) for i in intro]
+    for i, k in enumerate(question_order):
+        n_opt = 0
+        for idx in question_layout(questions[k], option_orders[k]):
+            role = roles[idx]
+            if role == "q":
+                result.append((idx, f"Câu {i + 1}."))
+            elif role in ("mcq", "tf"):
+                letters = "ABCD" if role == "mcq" else "abcd"
+                result.append((idx, letters[min(n_opt, 3)]))
+                n_opt += 1
+            else:
+                result.append((idx, None))
+    return result
+
+
+# ==================== GỘP RUN (THU GỌN DOM) ====================
+
+def _is_plain_text_run(xd, node) -> bool:
+    """w:r chỉ gồm w:rPr + w:t. Run có OLE, hình, MathType, field, tab, ngắt dòng... không bao giờ gộp."""
+    if node is None or xd.w_local(node) != "r":
+        return False
+    for child in xd.siblings(node):
+        if child is None or xd.w_local(child) not in ("rPr", "t"):
+            return False
+    return True
+
+
+def _run_format_key(xd, run) -> bytes:
+    for child in xd.elements(run):
+        if xd.w_local(child) == "rPr":
+            return xd.serialize(child)
+    return b""
+
+
+def _set_t_text(xd, t, text):
+    xd.set_text(t, text)
+    if text != text.strip():
+        xd.preserve_space(t)
+
+
+def _absorb_run(xd, target, run) -> int:
+    """Chuyển text của `run` vào w:t cuối của `target`, xóa `run`. Trả về số nút đã bỏ."""
+    last_t = None
+    for child in xd.elements(target):
+        if xd.w_local(child) == "t":
+            last_t = child
+
+    removed = 1
+    for child in xd.elements(run):
+        if xd.w_local(child) == "rPr":
+            removed += xd.count_nodes(child)
+        elif last_t is None:
+            xd.append(target, child)
+            last_t = child
+        else:
+            _set_t_text(xd, last_t, (xd.text(last_t) or "") + (xd.text(child) or ""))
+            removed += xd.count_nodes(child)
+    xd.remove(run)
+    return removed
+
+
+def merge_adjacent_runs(xd, block) -> int:
+    """
+    Gộp các w:r liền kề có định dạng (w:rPr) giống hệt nhau thành 1 run.
+    Gọi sau khi đã đọc/bỏ gạch chân và đánh nhãn (nhãn xanh/đậm có rPr riêng nên không bị gộp).
+    Trả về số nút XML đã bỏ.
+    """
+    parents = OrderedDict()
+    for r in xd.descendants(block, "r"):
+        parent = xd.parent(r)
+        parents[id(parent)] = parent
+
+    removed = 0
+    for parent in parents.values():
+        prev = None
+        prev_key = None
+        for child in xd.siblings(parent):
+            if not _is_plain_text_run(xd, child):
+                prev = None
+                continue
+            key = _run_format_key(xd, child)
+            if prev is not None and key == prev_key:
+                removed += _absorb_run(xd, prev, child)
+            else:
+                prev, prev_key = child, key
+    return removed
+
+
+# ==================== ZIP: CHÉP NGUYÊN KHỐI NÉN ====================
+
+def is_dynamic_member(filename: str) -> bool:
+    """Thành phần có thể đổi theo mã đề (nội dung đề, token {{MA_DE}}); còn lại chép nguyên."""
+    if filename in ("word/document.xml", "word/footnotes.xml", "word/endnotes.xml"):
+        return True
+    return (filename.startswith("word/header") or filename.startswith("word/footer")) and filename.endswith(".xml")
+
+
+def _read_raw_member(fp, item):
+    """Dữ liệu đã nén của 1 thành phần, đọc thẳng sau local header; None nếu không chép được."""
+    if item.flag_bits & 0x01:
+        return None  # mã hóa
+    fp.seek(item.header_offset)
+    header = fp.read(zipfile.sizeFileHeader)
+    if len(header) != zipfile.sizeFileHeader or header[:4] != zipfile.stringFileHeader:
+        return None
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    fp.seek(item.header_offset + zipfile.sizeFileHeader + name_len + extra_len)
+    raw = fp.read(item.compress_size)
+    return raw if len(raw) == item.compress_size else None
+
+
+def write_chunks(dest, pieces, chunk_size=1 << 16):
+    """Ghi chuỗi đoạn bytes nhỏ vào dest, gom thành khối ~64 KB (ít lần gọi zlib)."""
+    buf = []
+    size = 0
+    for piece in pieces:
+        buf.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            dest.write(b"".join(buf))
+            buf = []
+            size = 0
+    if buf:
+        dest.write(b"".join(buf))
+
+
+class WriteOnlyStream:
+    """
+    Bọc 1 file để ZipFile chỉ thấy write/flush (không tell/seek) -> luôn ghi kiểu luồng, có data descriptor.
+    Mọi nơi dựng .docx đều đi qua đây nên file ghi vào BytesIO, file trên đĩa hay entry zout.open(..., "w")
+    giống nhau từng byte (render, render_version, process pool, cache, ghi thẳng vào ZIP cả lô).
+    """
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+
+    def write(self, data):
+        return self._fileobj.write(data)
+
+    def flush(self):
+        flush = getattr(self._fileobj, "flush", None)
+        if flush is not None:
+            flush()
+
+
+def copy_zip_info(item):
+    """
+    ZipInfo mới cùng tên/thời gian/thuộc tính với `item`.
+    ZipFile ghi offset, CRC... vào ZipInfo được truyền vào -> không dùng chung ZipInfo của template
+    giữa các lần ghi (nhiều luồng/phiên có thể render cùng 1 template).
+    """
+    zinfo = zipfile.ZipInfo(item.filename, item.date_time)
+    zinfo.compress_type = item.compress_type
+    zinfo.comment = item.comment
+    zinfo.create_system = item.create_system
+    zinfo.external_attr = item.external_attr or (0o600 << 16)
+    return zinfo
+
+
+def write_raw_member(zout, item, raw):
+    """
+    Ghi 1 thành phần đã nén sẵn vào zout (không giải nén / nén lại).
+    Tương đương zout.writestr() nhưng CRC, kích thước và dữ liệu nén lấy từ file gốc.
+    Dùng thuộc tính nội bộ của zipfile (CPython) -> chỉ gọi khi RAW_MEMBER_COPY bật.
+    """
+    zinfo = copy_zip_info(item)
+    zinfo.flag_bits = item.flag_bits & ~0x08  # đã biết CRC/kích thước -> không cần data descriptor
+    zinfo.CRC = item.CRC
+    zinfo.file_size = item.file_size
+    zinfo.compress_size = len(raw)
+
+    with zout._lock:
+        if zout._writing:
+            raise ValueError("Can't write to ZIP archive while an open writing handle exists.")
+        if zout._seekable:
+            zout.fp.seek(zout.start_dir)
+        zinfo.header_offset = zout.fp.tell()
+        zout._writecheck(zinfo)
+        zout._didModify = True
+        zout.fp.write(zinfo.FileHeader())
+        zout.fp.write(raw)
+        zout.filelist.append(zinfo)
+        zout.NameToInfo[zinfo.filename] = zinfo
+        zout.start_dir = zout.fp.tell()
+
+
+# zipfile không có API công khai để chép dữ liệu đã nén; write_raw_member dựa vào phần nội bộ
+# của CPython (ổn định từ 3.8 tới 3.13). Phiên bản khác / thiếu thuộc tính / ghi thử sai
+# -> tắt, mọi thành phần tĩnh đọc ra bytes và ghi bằng zout.writestr() như thường.
+# Thuộc tính dùng tới (_ZIPFILE_INTERNALS): _lock, _writing, _seekable, _writecheck(), _didModify,
+# start_dir, fp, filelist, NameToInfo. Chép theo khối "with self._lock:" cuối ZipFile.mkdir()
+# trong Lib/zipfile.py của CPython 3.11.7 (3.8-3.10: nhánh thư mục của ZipFile.write();
+# 3.12+: Lib/zipfile/__init__.py) và kiểm tra _writing trong ZipFile._open_to_write();
+# đã chạy thử trên 3.8.18, 3.9.18, 3.10.13, 3.11.7, 3.12.1, 3.13.0.
+# Nâng RAW_MEMBER_COPY_VERSIONS chỉ sau khi đối chiếu lại các chỗ này và chạy tests/test_raw_members.py.
+RAW_MEMBER_COPY_VERSIONS = ((3, 8), (3, 13))
+_ZIPFILE_INTERNALS = ("_lock", "_writing", "_seekable", "_writecheck", "_didModify", "start_dir",
+                      "fp", "filelist", "NameToInfo")
+
+
+def _probe_raw_member_copy():
+    low, high = RAW_MEMBER_COPY_VERSIONS
+    if sys.implementation.name != "cpython" or not low <= sys.version_info[:2] <= high:
+        return False
+    try:
+        payload = b"tron-de " * 64
+        src = io.BytesIO()
+        with zipfile.ZipFile(src, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("probe.bin", payload)
+        with zipfile.ZipFile(src, "r") as zin:
+            item = zin.infolist()[0]
+            raw = _read_raw_member(zin.fp, item)
+        for streamed in (False, True):
+            dest = io.BytesIO()
+            with zipfile.ZipFile(WriteOnlyStream(dest) if streamed else dest, "w") as zout:
+                if not all(hasattr(zout, name) for name in _ZIPFILE_INTERNALS):
+                    return False
+                write_raw_member(zout, item, raw)
+                zout.writestr("after.txt", b"ok")
+            with zipfile.ZipFile(dest, "r") as check:
+                if check.testzip() is not None or check.read("probe.bin") != payload:
+                    return False
+        return True
+    except Exception:
+        return False
+
+
+RAW_MEMBER_COPY = _probe_raw_member_copy()
+
+
+def read_docx_members(file_bytes, backend=None):
+    """
+    [(ZipInfo, data | None, raw | None)] của mọi thành phần trong file .docx, giữ nguyên thứ tự.
+    Thành phần không đổi theo mã đề (ảnh, OLE, MathType...) chỉ giữ bản nén gốc `raw`
+    để mỗi mã đề chép thẳng; header/footer/footnotes/endnotes được giải nén và
+    compile_placeholders sẵn; document.xml giữ nguyên bytes để biên dịch riêng.
+    """
+    members = []
+    with zipfile.ZipFile(io.BytesIO(file_bytes), "r") as zin:
+        for item in zin.infolist():
+            raw = None
+            if RAW_MEMBER_COPY and not is_dynamic_member(item.filename):
+                raw = _read_raw_member(zin.fp, item)
+            data = zin.read(item.filename) if raw is None else None
+            if data is not None and item.filename != "word/document.xml" and is_dynamic_member(item.filename):
+                data = prepare_placeholder_part(data, backend)
+            members.append((item, data, raw))
+    return members
+
+
+# ==================== DOCX TEMPLATE (PARSE 1 LẦN CHO CẢ LÔ) ====================
+
+# Ký tự đánh dấu chỗ đặt nhãn trong fragment; XML hợp lệ không thể chứa \x00.
+LABEL_SLOT = "\x00"
+
+
+def _find_body(xd):
+    for child in xd.elements(xd.root):
+        if xd.w_local(child) == "body":
+            return child
+    body = xd.first(xd.root, "body")
+    if body is None:
+        raise Exception("Không tìm thấy w:body trong document.xml")
+    return body
+
+
+def _body_blocks(xd, body):
+    return [child for child in xd.elements(body) if xd.w_local(child) in ("p", "tbl")]
+
+
+class DocxTemplate:
+    """
+    Đề gốc đã biên dịch sẵn: mỗi block (p/tbl) được serialize thành bytes đúng 1 lần,
+    nhãn Câu N. / A. / a) để trống thành "khe" (LABEL_SLOT).
+    Mỗi mã đề chỉ nối các fragment theo thứ tự trộn và điền nhãn — không đụng tới DOM.
+    """
+
+    def __init__(self, members, head, tail, fragments, roles, preamble, parts, source_hash=None, merged_nodes=0):
+        self.source_hash = source_hash  # sha256 của file .docx gốc (khóa cache)
+        self.merged_nodes = merged_nodes  # số nút XML đã bỏ nhờ gộp run (merge_adjacent_runs)
+        self.members = members      # [(ZipInfo, bytes | None, raw | None)] theo thứ tự trong file gốc
+        self.head = head            # bytes document.xml trước block đầu tiên của w:body
+        self.tail = tail            # bytes sau block cuối (sectPr... + </w:body></w:document>)
+        self.fragments = fragments  # fragments[i] = (đoạn,) hoặc (trước_nhãn, sau_nhãn); đoạn = kết quả compile_placeholders
+        self.roles = roles          # roles[i] = "q" | "mcq" | "tf" | None
+        self.preamble = preamble    # chỉ số các block trước tiêu đề PHẦN đầu tiên
+        self.parts = parts          # [(part_type, header_idx, intro_idx, [question_spec, ...])]
+
+    def to_state(self):
+        """Phần đã biên dịch (chỉ gồm kiểu dữ liệu cơ bản) để lưu cache đĩa; không gồm ZIP members."""
+        return {
+            "source_hash": self.source_hash,
+            "head": self.head,
+            "tail": self.tail,
+            "fragments": self.fragments,
+            "roles": self.roles,
+            "preamble": self.preamble,
+            "parts": self.parts,
+            "merged_nodes": self.merged_nodes,
+        }
+
+    @classmethod
+    def from_state(cls, state, members):
+        return cls(
+            members, state["head"], state["tail"], state["fragments"], state["roles"],
+            state["preamble"], state["parts"], source_hash=state["source_hash"],
+            merged_nodes=state["merged_nodes"]
+        )
+
+    def nbytes(self) -> int:
+        """Ước lượng dung lượng template trong RAM (để giới hạn cache)."""
+        total = placeholder_nbytes(self.head) + placeholder_nbytes(self.tail)
+        total += sum(placeholder_nbytes(data) if raw is None else len(raw) for _, data, raw in self.members)
+        total += sum(placeholder_nbytes(piece) for pieces in self.fragments for piece in pieces)
+        return total
+
+    def _pieces(self, idx, label=None):
+        pieces = self.fragments[idx]
+        yield pieces[0]
+        if len(pieces) > 1:
+            yield (label or "").encode("utf-8")
+            yield pieces[1]
+
+    def document_pieces(self, orders, ma_de=None, ma_de_mode="full"):
+        """
+        document.xml của 1 mã đề dưới dạng chuỗi các đoạn bytes (không nối thành 1 khối).
+        Vị trí token mã đề đã tìm sẵn lúc biên dịch -> chỉ ghép giá trị vào đúng chỗ.
+        """
+        values = placeholder_values(ma_de, ma_de_mode) if ma_de is not None else None
+
+        def fill(piece):
+            return fill_placeholders(piece, values)
+
+        yield fill(self.head)
+        for i in self.preamble:
+            yield from map(fill, self._pieces(i))
+
+        for (_, header_idx, intro_idx, questions), (question_order, option_orders) in zip(self.parts, orders):
+            yield from map(fill, self._pieces(header_idx))
+            for idx, label in process_part(intro_idx, questions, self.roles, question_order, option_orders):
+                yield from map(fill, self._pieces(idx, label))
+
+        yield fill(self.tail)
+
+    def render(self, orders, ma_de=None, ma_de_mode="full"):
+        """Dựng file .docx của 1 mã đề theo hoán vị `orders` (xem draw_version_orders)."""
+        output_buffer = io.BytesIO()
+        self.render_to(output_buffer, orders, ma_de=ma_de, ma_de_mode=ma_de_mode)
+        return output_buffer.getvalue()
+
+    def render_to(self, fileobj, orders, ma_de=None, ma_de_mode="full"):
+        """
+        Như render() nhưng ghi thẳng vào `fileobj` (file, BytesIO hoặc entry zout.open(..., "w")).
+        Luôn ghi qua WriteOnlyStream (data descriptor, không seek lại) -> cùng 1 dạng byte cho mọi fileobj,
+        không cần bản sao trong RAM.
+        """
+        values = placeholder_values(ma_de, ma_de_mode) if ma_de is not None else None
+        with zipfile.ZipFile(WriteOnlyStream(fileobj), "w", zipfile.ZIP_DEFLATED) as zout:
+            for item, data, raw in self.members:
+                if raw is not None:
+                    write_raw_member(zout, item, raw)
+                    continue
+
+                if item.filename == "word/document.xml":
+                    # nén dần từng đoạn vào entry, không dựng cả document.xml trong RAM
+                    with zout.open(copy_zip_info(item), "w") as dest:
+                        write_chunks(dest, self.document_pieces(orders, ma_de, ma_de_mode))
+                    continue
+
+                zout.writestr(copy_zip_info(item), fill_placeholders(data, values))
+
+
+def compile_docx_template(file_bytes, shuffle_mode="auto", merge_runs=True, backend=None):
+    """
+    Đọc + parse file .docx 1 lần, chia PHẦN 1/2/3, câu hỏi và serialize sẵn từng block.
+    merge_runs: gộp run cùng định dạng trước khi serialize (fragment nhỏ hơn, đề trộn gọn hơn).
+    backend: "etree" (mặc định, nhanh) hoặc "minidom" (bản tham chiếu); kết quả như nhau.
+    """
+    members = read_docx_members(file_bytes, backend)
+
+    doc_xml = next((data for item, data, _ in members if item.filename == "word/document.xml"), None)
+    if doc_xml is None:
+        raise Exception("Không tìm thấy word/document.xml trong file .docx")
+    xd = open_xml(doc_xml, backend)
+    merge_split_placeholders(xd, xd.root)
+    body = _find_body(xd)
+    blocks = _body_blocks(xd, body)
+    index = build_block_index(xd, blocks)
+
+    if shuffle_mode != "auto":
+        raise Exception("Bản XLSX tối ưu theo cấu trúc 3 phần. Vui lòng chọn chế độ 'Tự động (PHẦN 1,2,3)'.")
+
+    structure = tokenize_body(index)
+    if not structure.parts:
+        raise Exception("Không tìm thấy 'PHẦN 1/2/3'. Hãy kiểm tra lại tiêu đề phần trong Word.")
+
+    roles = [None] * len(blocks)
+    preamble = structure.preamble
+    parts = []
+    for section in structure.parts:
+        part_type = "PHAN%d" % section.number
+
+        questions = []
+        for group in section.questions:
+            if part_type == "PHAN1":
+                q = compile_mcq_question(xd, index, group)
+            elif part_type == "PHAN2":
+                q = compile_tf_question(xd, index, group)
+            else:
+                q = compile_short_answer_question(index, group)
+            questions.append(q)
+
+            # Nhãn được đánh lại ở mọi mã đề -> tô xanh/đậm 1 lần và để khe cho nhãn mới
+            first = group.blocks[0]
+            roles[first] = "q"
+            update_question_label(xd, index[first].texts, LABEL_SLOT)
+            for idx in question_layout(q):
+                if part_type == "PHAN1" and index[idx].mcq:
+                    roles[idx] = "mcq"
+                    update_mcq_label(xd, index[idx].texts, LABEL_SLOT)
+                elif part_type == "PHAN2" and index[idx].tf_letter:
+                    roles[idx] = "tf"
+                    update_tf_label(xd, index[idx].texts, LABEL_SLOT)
+
+        parts.append((part_type, section.header, section.intro, questions))
+
+    merged_nodes = sum(merge_adjacent_runs(xd, b) for b in blocks) if merge_runs else 0
+
+    slot = LABEL_SLOT.encode("utf-8")
+    fragments = [
+        tuple(compile_placeholders(piece) for piece in xd.serialize(b).split(slot))
+        for b in blocks
+    ]
+
+    # w:body chỉ còn khe + các phần tử không phải block (sectPr...) -> tách head/tail
+    other_nodes = [child for child in xd.elements(body) if xd.w_local(child) not in ("p", "tbl")]
+    xd.replace_children(body, LABEL_SLOT, other_nodes)
+    head, tail = (compile_placeholders(piece) for piece in xd.serialize_document().split(slot))
+
+    return DocxTemplate(
+        members, head, tail, fragments, roles, preamble, parts,
+        source_hash=hashlib.sha256(file_bytes).hexdigest(), merged_nodes=merged_nodes
+    )
+
+
+def shuffle_docx(file_bytes, shuffle_mode="auto", ma_de=None, ma_de_mode="full", rng=None):
+    template = compile_docx_template(file_bytes, shuffle_mode)
+    orders = draw_version_orders(template, rng)
+    answers_all = ShufflePlan(template, [ma_de or 0], [orders]).answers()[0]
+    return template.render(orders, ma_de=ma_de, ma_de_mode=ma_de_mode), answers_all
+
+
+# ==================== KIỂM TRA NHANH FILE (PRE-FLIGHT) ====================
+
+def _question_number(index, group, k):
+    m = QUESTION_LABEL_RE.match(index[group.blocks[0]].text)
+    return m.group(3) if m else str(k)
+
+
+def analyze_docx(file_bytes, backend=None):
+    """
+    Kiểm tra nhanh cấu trúc đề ngay khi tải lên (chỉ parse + chia PHẦN/câu, không trộn, không serialize).
+    Trả về {"parts": [{"number", "questions", "options"}], "errors": [...], "warnings": [...]}:
+    - PHẦN 1: câu chưa gạch chân / gạch chân nhiều phương án, câu thiếu phương án A-D
+    - PHẦN 2: câu thiếu hoặc lặp ý a) b) c) d)
+    - PHẦN 3: câu thiếu (hoặc thừa) dòng 'Đáp án: ...'
+    """
+    try:
+        with zipfile.ZipFile(io.BytesIO(file_bytes), "r") as zin:
+            doc_xml = zin.read("word/document.xml")
+    except KeyError:
+        raise Exception("Không tìm thấy word/document.xml trong file .docx")
+    except zipfile.BadZipFile:
+        raise Exception("File không phải .docx hợp lệ (không đọc được ZIP).")
+
+    xd = open_xml(doc_xml, backend)
+    body = _find_body(xd)
+    index = build_block_index(xd, _body_blocks(xd, body))
+    structure = tokenize_body(index)
+
+    report = {"parts": [], "errors": [], "warnings": []}
+    errors = report["errors"]
+    warnings = report["warnings"]
+    if not structure.parts:
+        errors.append("Không tìm thấy 'PHẦN 1/2/3'. Hãy kiểm tra lại tiêu đề phần trong Word.")
+        return report
+
+    for section in structure.parts:
+        options = []
+        if not section.questions:
+            warnings.append(f"PHẦN {section.number}: không có câu nào (dòng phải bắt đầu bằng 'Câu N').")
+
+        for k, group in enumerate(section.questions, 1):
+            where = f"PHẦN {section.number} – Câu {_question_number(index, group, k)}"
+            if section.number == 1:
+                opts = group.mcq_options
+                marked = sum(1 for i in opts if index[i].underlined)
+                options.append(len(opts))
+                if len(opts) < 2:
+                    warnings.append(f"{where}: chỉ có {len(opts)} phương án A-D → giữ nguyên, đáp án để trống.")
+                elif marked == 0:
+                    errors.append(f"{where}: chưa gạch chân đáp án đúng.")
+                elif marked > 1:
+                    errors.append(f"{where}: gạch chân {marked} phương án (chỉ được 1).")
+            elif section.number == 2:
+                letters = [index[i].tf_letter for i in group.tf_options]
+                distinct = sorted(set(letters))
+                options.append(len(distinct))
+                if len(distinct) < 2:
+                    warnings.append(f"{where}: chỉ có {len(distinct)} ý a) b) c) d) → giữ nguyên, không trộn.")
+                else:
+                    missing = [c + ")" for c in "abcd" if c not in distinct]
+                    if missing:
+                        warnings.append(f"{where}: thiếu ý {', '.join(missing)}.")
+                    if len(letters) != len(distinct):
+                        warnings.append(f"{where}: có ý bị lặp (chỉ lấy ý xuất hiện sau cùng).")
+            else:
+                options.append(0)
+                n = len(group.answer_lines)
+                if n == 0:
+                    errors.append(f"{where}: thiếu dòng 'Đáp án: ...'.")
+                elif n > 1:
+                    warnings.append(f"{where}: có {n} dòng 'Đáp án:' (lấy dòng đầu tiên).")
+
+        report["parts"].append({
+            "number": section.number,
+            "questions": len(section.questions),
+            "options": options,
+        })
+    return report
+
+
+# ==================== KẾ HOẠCH TRỘN (PERMUTATION PLAN) ====================
+
+def draw_version_orders(template, rng=None):
+    """
+    Rút hoán vị của 1 mã đề: từng phần, phương án của từng câu rồi tới thứ tự câu.
+    -> [(question_order, [option_order hoặc None, ...]) cho mỗi phần]
+    """
+    orders = []
+    for _, _, _, questions in template.parts:
+        option_orders = []
+        for q in questions:
+            if q["shuffle"]:
+                option_orders.append(shuffle_array(list(range(len(q["options"]))), rng))
+            else:
+                option_orders.append(None)
+        question_order = shuffle_array(list(range(len(questions))), rng)
+        orders.append((question_order, option_orders))
+    return orders
+
+
+class ShufflePlan:
+    """
+    Kế hoạch trộn của cả lô, lưu bằng mảng số nguyên (V = số mã đề):
+    - question_order[p]: int16 (V, số câu) — vị trí mới -> chỉ số câu gốc
+    - option_order[p][k]: int8 (V, số phương án được trộn) hoặc None nếu câu k không trộn phương án
+    Đáp án mọi mã đề tính hàng loạt từ đáp án gốc + hoán vị, không cần dựng file .docx nào.
+    """
+
+    def __init__(self, template, codes, orders_per_version):
+        self.template = template
+        self.codes = np.asarray(codes, dtype=np.int32)
+        n = len(self.codes)
+
+        self.question_order = []
+        self.option_order = []
+        for p, (_, _, _, questions) in enumerate(template.parts):
+            self.question_order.append(
+                np.array([orders[p][0] for orders in orders_per_version], dtype=np.int16).reshape(n, len(questions))
+            )
+            per_question = []
+            for k, q in enumerate(questions):
+                if q["shuffle"]:
+                    per_question.append(np.array([orders[p][1][k] for orders in orders_per_version], dtype=np.int8))
+                else:
+                    per_question.append(None)
+            self.option_order.append(per_question)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def version_orders(self, v):
+        """Hoán vị của mã đề thứ v, dạng list thuần (dùng cho render / gửi sang worker)."""
+        return [
+            (self.question_order[p][v].tolist(), [None if o is None else o[v].tolist() for o in per_question])
+            for p, per_question in enumerate(self.option_order)
+        ]
+
+    def _part_answer_ids(self, p):
+        """Mỗi câu gốc k có 1 dải chuỗi đáp án trong bảng; trả về (ids theo câu gốc (V, nq), bảng chuỗi)."""
+        part_type, _, _, questions = self.template.parts[p]
+        n = len(self)
+        table = []
+        ids = np.zeros((n, len(questions)), dtype=np.int32)
+
+        for k, q in enumerate(questions):
+            base = len(table)
+            perm = self.option_order[p][k]
+            if perm is None:
+                table.append(q["answer"] or "")
+                ids[:, k] = base
+            elif part_type == "PHAN1":
+                # vị trí mới đầu tiên mang chữ cái của phương án đúng ("" nếu không có gạch chân)
+                letters = np.array([ord(c) if c else 0 for c in q["letters"]], dtype=np.int32)
+                match = letters[perm] == (ord(q["correct"]) if q["correct"] else -1)
+                table.append("")
+                table.extend(chr(ord("A") + pos) for pos in range(perm.shape[1]))
+                ids[:, k] = base + np.where(match.any(axis=1), match.argmax(axis=1) + 1, 0)
+            else:
+                # PHẦN 2: mã hóa dãy Đ/S sau hoán vị thành bitmask -> tra bảng 2^m chuỗi
+                m = perm.shape[1]
+                truths = np.array(q["truths"], dtype=np.int32)[perm]
+                bits = (truths << np.arange(m, dtype=np.int32)).sum(axis=1)
+                for mask in range(1 << m):
+                    table.append(tf_key_string([bool(mask >> j & 1) for j in range(m)] + q["fixed_truths"]))
+                ids[:, k] = base + bits
+
+        return ids, table
+
+    def answer_table(self):
+        """{part: mảng object (V, số câu) chuỗi đáp án theo thứ tự câu SAU khi trộn}."""
+        out = {}
+        for p, (part_type, _, _, _) in enumerate(self.template.parts):
+            ids, table = self._part_answer_ids(p)
+            new_ids = np.take_along_axis(ids, self.question_order[p].astype(np.intp), axis=1)
+            out[int(part_type[-1])] = np.array(table, dtype=object)[new_ids]
+        return out
+
+    def answers(self):
+        """Danh sách answers_all cho từng mã đề (cùng định dạng build_answer_table_xlsx dùng)."""
+        rows = [[] for _ in range(len(self))]
+        for part, matrix in self.answer_table().items():
+            for v, values in enumerate(matrix.tolist()):
+                rows[v].extend({"part": part, "q": i + 1, "answer": ans} for i, ans in enumerate(values))
+        return rows
+
+
+def new_batch_seed() -> str:
+    """Seed ngẫu nhiên 9 chữ số cho 1 lô đề (dễ ghi lại / nhập lại)."""
+    return str(100000000 + secrets.randbelow(900000000))
+
+
+def version_seed(seed, ma_de) -> int:
+    """
+    Seed riêng của 1 mã đề = hash(seed lô, mã đề).
+    Không phụ thuộc số mã đề hay thứ tự sinh -> sinh lại riêng 1 mã đề bất kỳ vẫn ra đúng đề + đáp án cũ.
+    """
+    digest = hashlib.sha256(f"{str(seed).strip()}:{int(ma_de)}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def build_shuffle_plan(template, codes, seed):
+    """Kế hoạch trộn cho các mã đề `codes` của lô có seed đã cho (mỗi mã đề 1 RNG riêng)."""
+    orders = [draw_version_orders(template, random.Random(version_seed(seed, code))) for code in codes]
+    return ShufflePlan(template, codes, orders)
+
+
+def render_version(template, ma_de, ma_de_mode="full", seed=None):
+    """Sinh lại đúng 1 mã đề của lô có seed đã biết -> (docx_bytes, answers)."""
+    plan = build_shuffle_plan(template, [int(ma_de)], seed)
+    orders = plan.version_orders(0)
+    return template.render(orders, ma_de=int(ma_de), ma_de_mode=ma_de_mode), plan.answers()[0]
+
+
+# ==================== SONG SONG (PROCESS POOL) ====================
+
+_WORKER_TEMPLATE = None
+
+
+def _init_render_worker(template):
+    global _WORKER_TEMPLATE
+    _WORKER_TEMPLATE = template
+
+
+def _render_job(template, job):
+    ma_de, ma_de_mode, orders = job
+    return template.render(orders, ma_de=ma_de, ma_de_mode=ma_de_mode)
+
+
+def _render_in_worker(job):
+    return _render_job(_WORKER_TEMPLATE, job)
+
+
+def pool_start_method():
+    """
+    Cách khởi tạo process cho pool sinh đề.
+    fork chỉ an toàn khi gọi từ main thread (CLI): trên server Streamlit, lô chạy trên thread nền
+    trong 1 process nhiều thread -> fork có thể chép theo khóa đang bị thread khác giữ và treo.
+    Khi đó dùng forkserver (hoặc spawn); template được pickle 1 lần cho mỗi worker qua initargs.
+    """
+    import multiprocessing
+    methods = multiprocessing.get_all_start_methods()
+    if "fork" in methods and threading.current_thread() is threading.main_thread():
+        return "fork"
+    if "forkserver" in methods:
+        return "forkserver"
+    return "spawn"
+
+
+def render_versions(template, jobs, workers=1):
+    """
+    Sinh docx_bytes cho từng job (ma_de, ma_de_mode, orders), đúng thứ tự jobs.
+    workers > 1 -> chia cho process pool; kết quả giống hệt chạy tuần tự vì hoán vị đã có sẵn trong job.
+    """
+    if workers <= 1 or len(jobs) < 2:
+        for job in jobs:
+            yield _render_job(template, job)
+        return
+
+    # chỉ nạp multiprocessing / process pool khi có chạy song song
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    executor = ProcessPoolExecutor(
+        max_workers=min(workers, len(jobs)),
+        mp_context=multiprocessing.get_context(pool_start_method()),
+        initializer=_init_render_worker,
+        initargs=(template,)
+    )
+    # nộp theo cửa sổ trượt -> số file .docx chờ ghi trong RAM không tăng theo số mã đề
+    window = 2 * workers
+    pending = deque()
+    try:
+        for job in jobs:
+            pending.append(executor.submit(_render_in_worker, job))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # dừng giữa chừng (generator bị close) -> hủy các job chưa chạy;
+        # job đang chạy dở (tối đa `workers` job) vẫn phải chờ xong rồi pool mới đóng
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+# ==================== CACHE (GIỮ KẾT QUẢ GIỮA CÁC LẦN RERUN) ====================
+
+class LRUByteCache:
+    """
+    Cache LRU giới hạn theo tổng dung lượng (byte), dùng chung cho mọi phiên trên server.
+    Mỗi phiên Streamlit chạy trên 1 thread riêng nên mọi thao tác đều có khóa.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self.total_bytes = 0
+        self._items = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return default
+            self._items.move_to_end(key)
+            return item[0]
+
+    def put(self, key, value, size):
+        """Thêm/ghi đè 1 mục rồi loại các mục lâu không dùng cho tới khi về dưới ngân sách."""
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self._items[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self.total_bytes -= evicted_size
+        return value
+
+
+# Tăng khi cấu trúc hoặc nội dung biên dịch của DocxTemplate.to_state() thay đổi -> cache đĩa cũ tự bị bỏ qua
+TEMPLATE_CACHE_VERSION = 7
+# marshal đổi định dạng theo phiên bản Python -> đưa vào tên file
+TEMPLATE_CACHE_SUFFIX = f"-v{TEMPLATE_CACHE_VERSION}-py{sys.version_info[0]}{sys.version_info[1]}.marshal"
+
+
+def _is_private(info):
+    """File/thư mục thuộc user hiện tại và người khác không ghi được (Windows: không có uid -> bỏ qua)."""
+    if not hasattr(os, "getuid"):
+        return True
+    return info.st_uid == os.getuid() and not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+class DiskTemplateCache:
+    """
+    Cache template đã biên dịch trên đĩa, sống qua các lần khởi động lại server.
+    - Khóa: sha256 file + shuffle_mode + TEMPLATE_CACHE_VERSION
+    - Ghi nguyên tử (file tạm + os.replace): nhiều tiến trình đọc cùng lúc không bao giờ thấy file dở dang
+    - Vượt dung lượng -> xóa file lâu không dùng nhất (mtime được "chạm" mỗi lần đọc)
+    - Lưu bằng marshal (không chạy code khi đọc như pickle); thư mục 0o700, chỉ đọc file của chính user
+    Chỉ lưu phần đã biên dịch; ZIP members lấy lại từ chính file upload.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = int(max_bytes)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        info = os.stat(directory)
+        if hasattr(os, "getuid") and info.st_uid != os.getuid():
+            raise PermissionError(f"Thư mục cache {directory} không thuộc user hiện tại")
+        if stat.S_IMODE(info.st_mode) & 0o077:
+            os.chmod(directory, 0o700)
+
+    def _path(self, source_hash, shuffle_mode):
+        return os.path.join(self.directory, f"{source_hash}-{shuffle_mode}{TEMPLATE_CACHE_SUFFIX}")
+
+    def load(self, file_bytes, source_hash, shuffle_mode="auto"):
+        path = self._path(source_hash, shuffle_mode)
+        try:
+            with open(path, "rb") as f:
+                # file do người khác tạo/sửa được -> không tin, biên dịch lại
+                if not _is_private(os.fstat(f.fileno())):
+                    return None
+                # marshal chỉ dựng lại dữ liệu cơ bản (bytes/str/list/tuple/dict/int), không chạy code như pickle
+                state = marshal.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # file hỏng (ví dụ đĩa đầy lúc ghi ở phiên bản cũ) -> coi như chưa có
+            return None
+        if not isinstance(state, dict) or state.get("source_hash") != source_hash:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return DocxTemplate.from_state(state, read_docx_members(file_bytes))
+
+    def save(self, template, shuffle_mode="auto"):
+        path = self._path(template.source_hash, shuffle_mode)
+        data = marshal.dumps(template.to_state())
+        if len(data) > self.max_bytes:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            # .pkl: định dạng cũ, để tự bị loại dần
+            if not name.endswith((".marshal", ".pkl")):
+                continue
+            try:
+                info = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((info.st_mtime, info.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                # tiến trình khác đã xóa trước, hoặc file đang mở trên Windows
+                continue
+            total -= size
+
+
+def cached_compile_template(cache, file_bytes, shuffle_mode="auto", disk_cache=None):
+    """
+    Template theo nội dung file (sha256): RAM -> đĩa -> biên dịch mới.
+    Cùng 1 file upload lại / rerun / phiên khác không phải parse lại.
+    """
+    source_hash = hashlib.sha256(file_bytes).hexdigest()
+    key = ("template", source_hash, shuffle_mode)
+    template = cache.get(key)
+    if template is not None:
+        return template
+
+    if disk_cache is not None:
+        template = disk_cache.load(file_bytes, source_hash, shuffle_mode)
+    if template is None:
+        template = compile_docx_template(file_bytes, shuffle_mode)
+        if disk_cache is not None:
+            disk_cache.save(template, shuffle_mode)
+
+    cache.put(key, template, template.nbytes())
+    return template
+
+
+def _version_cache_key(template, seed, ma_de, ma_de_mode):
+    return ("docx", template.source_hash, str(seed), int(ma_de), ma_de_mode)
+
+
+def lookup_rendered_versions(cache, template, plan, ma_de_mode, seed):
+    """{ma_de: docx_bytes} của các mã đề trong plan đã có sẵn trong cache (không sinh thêm)."""
+    rendered = {}
+    for c in plan.codes:
+        data = cache.get(_version_cache_key(template, seed, c, ma_de_mode))
+        if data is not None:
+            rendered[int(c)] = data
+    return rendered
+
+
+def cached_render_versions(cache, template, plan, ma_de_mode, seed, codes=None, workers=1):
+    """
+    {ma_de: docx_bytes} cho các mã đề `codes` (mặc định cả plan).
+    Khóa cache = (file gốc, seed, mã đề, ma_de_mode) -> chỉ sinh những mã đề chưa có.
+    """
+    all_codes = [int(c) for c in plan.codes]
+    v_of = {c: v for v, c in enumerate(all_codes)}
+    wanted = all_codes if codes is None else [int(c) for c in codes]
+    keys = {c: _version_cache_key(template, seed, c, ma_de_mode) for c in wanted}
+
+    rendered = {}
+    for c in wanted:
+        data = cache.get(keys[c])
+        if data is not None:
+            rendered[c] = data
+
+    jobs = [
+        (c, ma_de_mode, plan.version_orders(v_of[c]))
+        for c in wanted if c not in rendered
+    ]
+    for (c, _, _), data in zip(jobs, render_versions(template, jobs, workers=workers)):
+        rendered[c] = cache.put(keys[c], data, len(data))
+    return rendered
+
+
+# ==================== XLSX ANSWER BUILDER ====================
+
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '<Override PartName="/xl/sharedStrings.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+    '</Types>'
+)
+
+XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<bookViews><workbookView/></bookViews>'
+    '<sheets><sheet name="Đáp án" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '<Relationship Id="rId3" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" '
+    'Target="sharedStrings.xml"/>'
+    '</Relationships>'
+)
+
+# 4 kiểu ô dùng chung cho cả bảng (chỉ số s="..." trong sheet):
+# 0 mặc định • 1 ô đáp án (kẻ viền, căn giữa) • 2 nhóm tiêu đề dòng 1 • 3 tiêu đề "Câu i" dòng 2
+XLSX_CELL_STYLE, XLSX_GROUP_STYLE, XLSX_HEADER_STYLE = 1, 2, 3
+XLSX_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2">'
+    '<font><sz val="11"/><name val="Calibri"/><family val="2"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/><family val="2"/></font>'
+    '</fonts>'
+    '<fills count="4">'
+    '<fill><patternFill/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill>'
+    '<fill><patternFill patternType="solid"><fgColor rgb="00CCFBF1"/><bgColor rgb="00CCFBF1"/></patternFill></fill>'
+    '<fill><patternFill patternType="solid"><fgColor rgb="00E6FFFA"/><bgColor rgb="00E6FFFA"/></patternFill></fill>'
+    '</fills>'
+    '<borders count="2">'
+    '<border><left/><right/><top/><bottom/><diagonal/></border>'
+    '<border><left style="thin"><color rgb="0094A3B8"/></left><right style="thin"><color rgb="0094A3B8"/></right>'
+    '<top style="thin"><color rgb="0094A3B8"/></top><bottom style="thin"><color rgb="0094A3B8"/></bottom>'
+    '<diagonal/></border>'
+    '</borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="1" xfId="0" applyBorder="1" applyAlignment="1">'
+    '<alignment horizontal="center" vertical="center" wrapText="1"/></xf>'
+    '<xf numFmtId="0" fontId="1" fillId="2" borderId="1" xfId="0" applyFont="1" applyFill="1" applyBorder="1" '
+    'applyAlignment="1"><alignment horizontal="center" vertical="center" wrapText="1"/></xf>'
+    '<xf numFmtId="0" fontId="1" fillId="3" borderId="1" xfId="0" applyFont="1" applyFill="1" applyBorder="1" '
+    'applyAlignment="1"><alignment horizontal="center" vertical="center" wrapText="1"/></xf>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+XLSX_PART_TITLES = {1: "Trắc nghiệm khách quan", 2: "Trắc nghiệm đúng sai", 3: "Trắc nghiệm trả lời ngắn"}
+
+
+def column_letter(col: int) -> str:
+    """1 -> A, 27 -> AA (như openpyxl.utils.get_column_letter)."""
+    letters = ""
+    while col:
+        col, r = divmod(col - 1, 26)
+        letters = chr(65 + r) + letters
+    return letters
+
+
+def _xlsx_text(value: str) -> str:
+    text = _xml_escape(value)
+    if text != text.strip():
+        return f'<t xml:space="preserve">{text}</t>'
+    return f"<t>{text}</t>"
+
+
+def build_answer_table_xlsx(all_versions_answers, start_code: int, out=None):
+    """
+    Bảng đáp án .xlsx ghi thẳng SpreadsheetML, không dựng Workbook / Cell của openpyxl:
+    mỗi mã đề là 1 dòng <row> ghi dần vào entry ZIP, mọi ô dùng chung 3 kiểu trong styles.xml,
+    chuỗi đáp án lặp lại (A-D, ĐSĐS...) nằm 1 lần trong sharedStrings.
+    Bố cục giữ nguyên: merge nhóm tiêu đề, cột "Mã đề", kẻ bảng, căn giữa, freeze panes B3.
+    out = None -> trả về bytes; out = file (kể cả entry zout.open(..., "w")) -> ghi vào out.
+    """
+    max_p = {1: 0, 2: 0, 3: 0}
+    for answers in all_versions_answers:
+        for r in answers:
+            p = int(r.get("part", 0) or 0)
+            q = int(r.get("q", 0) or 0)
+            if p in max_p and q > max_p[p]:
+                max_p[p] = q
+
+    columns = [(p, q) for p in (1, 2, 3) for q in range(1, max_p[p] + 1)]
+    last_col = 1 + len(columns)
+    letters = [column_letter(c) for c in range(1, last_col + 1)]
+    last_row = 2 + len(all_versions_answers)
+
+    strings = {}
+    refs = [0]
+
+    def string_cell(ref, style, value):
+        refs[0] += 1
+        idx = strings.get(value)
+        if idx is None:
+            idx = strings[value] = len(strings)
+        return f'<c r="{ref}" s="{style}" t="s"><v>{idx}</v></c>'
+
+    # nhóm tiêu đề: cột bắt đầu / kết thúc của từng PHẦN có câu hỏi
+    groups = []
+    col = 2
+    for p in (1, 2, 3):
+        if max_p[p] > 0:
+            groups.append((p, col, col + max_p[p] - 1))
+            col += max_p[p]
+    group_at = {first: p for p, first, _ in groups}
+
+    def sheet_pieces():
+        yield (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<dimension ref="A1:{letters[-1]}{last_row}"/>'
+            '<sheetViews><sheetView workbookViewId="0">'
+            '<pane xSplit="1" ySplit="2" topLeftCell="B3" activePane="bottomRight" state="frozen"/>'
+            '<selection pane="topRight"/><selection pane="bottomLeft"/>'
+            '<selection pane="bottomRight" activeCell="B3" sqref="B3"/>'
+            '</sheetView></sheetViews>'
+            '<sheetFormatPr defaultRowHeight="15"/>'
+            '<cols><col min="1" max="1" width="10" customWidth="1"/>'
+            + (f'<col min="2" max="{last_col}" width="12" customWidth="1"/>' if last_col > 1 else "")
+            + '</cols><sheetData>'
+        ).encode("utf-8")
+
+        cells = []
+        for c in range(1, last_col + 1):
+            ref = f"{letters[c - 1]}1"
+            if c in group_at:
+                cells.append(string_cell(ref, XLSX_GROUP_STYLE, XLSX_PART_TITLES[group_at[c]]))
+            else:
+                cells.append(f'<c r="{ref}" s="{XLSX_GROUP_STYLE}"/>')
+        yield f'<row r="1" ht="22" customHeight="1">{"".join(cells)}</row>'.encode("utf-8")
+
+        cells = [string_cell("A2", XLSX_HEADER_STYLE, "Mã đề")]
+        cells.extend(
+            string_cell(f"{letters[c]}2", XLSX_HEADER_STYLE, f"Câu {q}") for c, (_, q) in enumerate(columns, 1)
+        )
+        yield f'<row r="2" ht="20" customHeight="1">{"".join(cells)}</row>'.encode("utf-8")
+
+        for idx, answers in enumerate(all_versions_answers):
+            rrow = 3 + idx
+            mp = {}
+            for r in answers:
+                mp[(int(r.get("part", 0) or 0), int(r.get("q", 0) or 0))] = r.get("answer", "") or ""
+
+            cells = [f'<row r="{rrow}"><c r="A{rrow}" s="{XLSX_CELL_STYLE}"><v>{start_code + idx}</v></c>']
+            for c, key in enumerate(columns, 1):
+                v = mp.get(key, "")
+                ref = f"{letters[c]}{rrow}"
+                if v == "":
+                    cells.append(f'<c r="{ref}" s="{XLSX_CELL_STYLE}"/>')
+                else:
+                    cells.append(string_cell(ref, XLSX_CELL_STYLE, str(v)))
+            cells.append("</row>")
+            yield "".join(cells).encode("utf-8")
+
+        tail = ["</sheetData>"]
+        if groups:
+            tail.append(f'<mergeCells count="{len(groups)}">')
+            tail.extend(f'<mergeCell ref="{letters[first - 1]}1:{letters[last - 1]}1"/>' for _, first, last in groups)
+            tail.append("</mergeCells>")
+        tail.append('<pageMargins left="0.75" right="0.75" top="1" bottom="1" header="0.5" footer="0.5"/></worksheet>')
+        yield "".join(tail).encode("utf-8")
+
+    target = io.BytesIO() if out is None else out
+    with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as zout:
+        zout.writestr("[Content_Types].xml", XLSX_CONTENT_TYPES)
+        zout.writestr("_rels/.rels", XLSX_ROOT_RELS)
+        zout.writestr("xl/workbook.xml", XLSX_WORKBOOK)
+        zout.writestr("xl/_rels/workbook.xml.rels", XLSX_WORKBOOK_RELS)
+        zout.writestr("xl/styles.xml", XLSX_STYLES)
+        with zout.open("xl/worksheets/sheet1.xml", "w") as dest:
+            write_chunks(dest, sheet_pieces())
+        # bảng chuỗi chỉ biết đủ sau khi ghi hết các dòng -> ghi sau sheet (thứ tự entry không quan trọng)
+        zout.writestr("xl/sharedStrings.xml", "".join([
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            f'count="{refs[0]}" uniqueCount="{len(strings)}">',
+            *(f"<si>{_xlsx_text(value)}</si>" for value in strings),
+            "</sst>",
+        ]))
+
+    if out is None:
+        return target.getvalue()
+    return out
+
+
+ANSWER_EXPORTS = {
+    "xlsx": ("DAPAN_TONG_HOP.xlsx", "Bảng Excel có định dạng (.xlsx)"),
+    "csv": ("DAPAN_DAI.csv", "CSV dạng dài: ma_de, part, question, answer"),
+    "wide": ("DAPAN_THEO_MA_DE.csv", "CSV mỗi mã đề 1 dòng (cột P1.C1, P1.C2, ...)"),
+    "json": ("DAPAN.json", "JSON (seed + đáp án từng mã đề)"),
+}
+DEFAULT_ANSWER_FORMATS = ("xlsx",)
+
+
+def _csv_lines(rows):
+    """Từng dòng CSV dạng bytes UTF-8 (ghi dần, không dựng cả file trong RAM)."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    for row in rows:
+        writer.writerow(row)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+
+
+def answer_csv_pieces(codes, table):
+    """CSV dạng dài cho phần mềm chấm: 1 dòng = (mã đề, phần, câu, đáp án)."""
+    parts = sorted(table)
+    rows_by_part = {part: table[part].tolist() for part in parts}
+
+    def rows():
+        yield ("ma_de", "part", "question", "answer")
+        for v, ma_de in enumerate(codes):
+            for part in parts:
+                for q, ans in enumerate(rows_by_part[part][v], 1):
+                    yield (int(ma_de), part, q, ans)
+
+    return _csv_lines(rows())
+
+
+def answer_wide_csv_pieces(codes, table):
+    """CSV cột: mỗi mã đề 1 dòng, mỗi câu 1 cột P<phần>.C<câu>."""
+    parts = sorted(table)
+    rows_by_part = {part: table[part].tolist() for part in parts}
+
+    def rows():
+        yield ["ma_de"] + [f"P{part}.C{q}" for part in parts for q in range(1, table[part].shape[1] + 1)]
+        for v, ma_de in enumerate(codes):
+            row = [int(ma_de)]
+            for part in parts:
+                row.extend(rows_by_part[part][v])
+            yield row
+
+    return _csv_lines(rows())
+
+
+def answer_json_pieces(codes, table, seed, ma_de_mode):
+    """JSON {"seed", "ma_de_mode", "questions": {phần: số câu}, "versions": [{"ma_de", "answers": {phần: [...]}}]}."""
+    parts = sorted(table)
+    rows_by_part = {part: table[part].tolist() for part in parts}
+    head = {
+        "seed": str(seed),
+        "ma_de_mode": ma_de_mode,
+        "questions": {str(part): int(table[part].shape[1]) for part in parts},
+    }
+    yield (json.dumps(head, ensure_ascii=False)[:-1] + ', "versions": [').encode("utf-8")
+    for v, ma_de in enumerate(codes):
+        version = {"ma_de": int(ma_de), "answers": {str(part): rows_by_part[part][v] for part in parts}}
+        yield (("" if v == 0 else ",\n") + json.dumps(version, ensure_ascii=False)).encode("utf-8")
+    yield b"]}\n"
+
+
+def batch_entry_info(name, compress_type=zipfile.ZIP_STORED):
+    """ZipInfo cho 1 file trong ZIP cả lô (giờ hiện tại, quyền 600)."""
+    info = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+    info.compress_type = compress_type
+    info.external_attr = 0o600 << 16
+    return info
+
+
+def write_answer_exports(zout, plan, seed, ma_de_mode, formats=DEFAULT_ANSWER_FORMATS):
+    """Ghi các file đáp án đã chọn (khóa trong ANSWER_EXPORTS) thẳng vào các entry của zout."""
+    codes = [int(c) for c in plan.codes]
+    table = plan.answer_table() if any(fmt != "xlsx" for fmt in formats) else None
+    for fmt in formats:
+        name = ANSWER_EXPORTS[fmt][0]
+        if fmt == "xlsx":
+            # .xlsx vốn đã nén -> STORED
+            with zout.open(batch_entry_info(name), "w") as dest:
+                build_answer_table_xlsx(plan.answers(), start_code=codes[0], out=dest)
+            continue
+        if fmt == "csv":
+            pieces = answer_csv_pieces(codes, table)
+        elif fmt == "wide":
+            pieces = answer_wide_csv_pieces(codes, table)
+        else:
+            pieces = answer_json_pieces(codes, table, seed, ma_de_mode)
+        with zout.open(batch_entry_info(name, zipfile.ZIP_DEFLATED), "w") as dest:
+            write_chunks(dest, pieces)
+
+
+def seed_info_text(seed, start_code, num_versions, ma_de_mode) -> str:
+    return (
+        f"Seed: {seed}\n"
+        f"Mã đề: {start_code} -> {start_code + num_versions - 1}\n"
+        f"Điền {{{{MA_DE}}}} theo: {ma_de_mode}\n"
+        "Nhập lại seed này + mã đề bắt đầu để sinh lại đúng đề và đáp án (kể cả riêng 1 mã đề).\n"
+    )
+
+
+def open_batch_spool():
+    """File tạm cho ZIP cả lô: nhỏ thì nằm trong RAM, vượt TRON_DE_SPOOL_MB thì tự chuyển xuống đĩa."""
+    max_size = int(os.environ.get("TRON_DE_SPOOL_MB", "32")) * 1024 * 1024
+    return tempfile.SpooledTemporaryFile(max_size=max_size, mode="w+b")
+
+
+def create_zip_multiple(file_bytes, base_name, num_versions, shuffle_mode, ma_de_mode, start_code,
+                        seed=None, workers=1, out=None, answer_formats=DEFAULT_ANSWER_FORMATS):
+    template = compile_docx_template(file_bytes, shuffle_mode)
+    if seed is None or not str(seed).strip():
+        seed = new_batch_seed()
+    codes = [start_code + i for i in range(num_versions)]
+    plan = build_shuffle_plan(template, codes, seed)
+    return build_batch_zip(template, plan, base_name, ma_de_mode, seed, workers=workers, out=out,
+                           answer_formats=answer_formats)
+
+
+class BatchCancelled(Exception):
+    """Người dùng hủy lô đang trộn (build_batch_zip dừng trước mã đề kế tiếp)."""
+
+
+def build_batch_zip(template, plan, base_name, ma_de_mode, seed, workers=1, rendered=None, out=None,
+                    progress=None, cancel=None, answer_formats=DEFAULT_ANSWER_FORMATS):
+    """
+    ZIP cả lô từ template + plan. rendered = {ma_de: docx_bytes} đã sinh trước đó thì dùng lại.
+    out = None -> trả về bytes; out = file (ví dụ open_batch_spool()) -> ghi dần từng mã đề vào out
+    và trả về chính out (đã seek về đầu), RAM không tăng theo số mã đề.
+    progress(done, total) được gọi sau mỗi mã đề; cancel (threading.Event) bật -> raise BatchCancelled.
+    answer_formats: các file đáp án kèm theo (khóa trong ANSWER_EXPORTS).
+    """
+    rendered = rendered or {}
+    codes = [int(c) for c in plan.codes]
+    start_code = codes[0]
+    v_of = {ma_de: v for v, ma_de in enumerate(codes)}
+    pending = [ma_de for ma_de in codes if ma_de not in rendered]
+    results = None
+    if workers > 1 and len(pending) > 1:
+        jobs = [(ma_de, ma_de_mode, plan.version_orders(v_of[ma_de])) for ma_de in pending]
+        results = render_versions(template, jobs, workers=workers)
+    target = io.BytesIO() if out is None else out
+
+    try:
+        with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as zout:
+            for done, ma_de in enumerate(codes):
+                if cancel is not None and cancel.is_set():
+                    raise BatchCancelled(f"Đã hủy sau {done}/{len(codes)} mã đề.")
+                # .docx vốn đã nén -> lưu nguyên (STORED), không deflate lần 2
+                info = batch_entry_info(f"{base_name}_V{ma_de}.docx")
+                if ma_de in rendered:
+                    zout.writestr(info, rendered[ma_de])
+                elif results is not None:
+                    zout.writestr(info, next(results))
+                else:
+                    with zout.open(info, "w") as dest:
+                        template.render_to(dest, plan.version_orders(v_of[ma_de]), ma_de=ma_de, ma_de_mode=ma_de_mode)
+                if progress is not None:
+                    progress(done + 1, len(codes))
+
+            write_answer_exports(zout, plan, seed, ma_de_mode, answer_formats)
+            zout.writestr("SEED.txt", seed_info_text(seed, start_code, len(codes), ma_de_mode))
+    finally:
+        if results is not None:
+            # hủy giữa chừng -> đóng generator: hủy các job đang chờ, đợi job đang chạy dở rồi đóng pool
+            results.close()
+
+    if out is None:
+        return target.getvalue()
+    out.seek(0)
+    return out
+
+
+# ==================== CHẤM BÀI (GRADING) ====================
+
+# Thang điểm 2025: PHẦN 1 mỗi câu 0,25 • PHẦN 2 đúng 1/2/3/4 ý -> 0,1/0,25/0,5/1 • PHẦN 3 mỗi câu 0,25 (Toán 0,5)
+MCQ_POINT = 0.25
+TF_POINTS = np.array([0.0, 0.1, 0.25, 0.5, 1.0])
+SHORT_POINT = 0.25
+SHORT_POINT_MATH = 0.5
+
+KEY_COLUMN_RE = re.compile(r"^P([1-3])\.C(\d+)$")
+STUDENT_ID_COLUMNS = ("sbd", "so_bao_danh", "student_id", "id")
+MA_DE_COLUMNS = ("ma_de", "made", "mã đề", "mã_đề")
+
+_MCQ_CODES = {"A": 0, "B": 1, "C": 2, "D": 3}
+_TF_CODES = {"Đ": 1, "D": 1, "T": 1, "1": 1, "S": 0, "F": 0, "0": 0}
+_BLANK = -1
+
+
+class AnswerKey:
+    """
+    Đáp án cả lô cho việc chấm: codes (V,) + table {phần: mảng object (V, số câu)} như ShufflePlan.answer_table().
+    origin {phần: (V, số câu)} = chỉ số câu trong đề gốc (chỉ có khi lấy từ plan) -> thống kê theo câu gốc.
+    """
+
+    def __init__(self, codes, table, origin=None):
+        self.codes = np.asarray(codes, dtype=np.int32)
+        self.table = {int(part): np.asarray(matrix, dtype=object) for part, matrix in table.items()}
+        self.origin = origin
+
+    @classmethod
+    def from_plan(cls, plan):
+        origin = {
+            int(part_type[-1]): plan.question_order[p]
+            for p, (part_type, _, _, _) in enumerate(plan.template.parts)
+        }
+        return cls(plan.codes, plan.answer_table(), origin)
+
+    @classmethod
+    def from_file(cls, data: bytes, name: str = ""):
+        """Đọc DAPAN_THEO_MA_DE.csv, DAPAN_DAI.csv hoặc DAPAN.json (xem write_answer_exports)."""
+        text = data.decode("utf-8-sig")
+        if name.lower().endswith(".json") or text.lstrip().startswith("{"):
+            doc = json.loads(text)
+            versions = doc.get("versions") or []
+            parts = sorted({int(part) for v in versions for part in v["answers"]})
+            table = {
+                part: [v["answers"].get(str(part), []) for v in versions]
+                for part in parts
+            }
+            return cls([v["ma_de"] for v in versions], _pad_table(table))
+
+        rows = list(csv.reader(io.StringIO(text)))
+        if not rows or not rows[0] or rows[0][0].strip().lower() != "ma_de":
+            raise Exception(
+                "File đáp án phải là DAPAN_THEO_MA_DE.csv / DAPAN_DAI.csv (cột đầu 'ma_de') hoặc DAPAN.json."
+            )
+        if [h.strip().lower() for h in rows[0][:4]] == ["ma_de", "part", "question", "answer"]:
+            return cls._from_long_rows(rows[1:])
+        columns = {}
+        for j, name_j in enumerate(rows[0][1:], 1):
+            m = KEY_COLUMN_RE.match(name_j.strip())
+            if m:
+                columns.setdefault(int(m.group(1)), []).append((int(m.group(2)), j))
+        body = [r for r in rows[1:] if r and r[0].strip()]
+        table = {
+            part: [[r[j] if j < len(r) else "" for _, j in sorted(cols)] for r in body]
+            for part, cols in columns.items()
+        }
+        return cls([int(r[0]) for r in body], table)
+
+    @classmethod
+    def _from_long_rows(cls, rows):
+        """DAPAN_DAI.csv: mỗi dòng (mã đề, phần, câu, đáp án), mã đề giữ thứ tự xuất hiện."""
+        versions = {}
+        for r in rows:
+            if len(r) < 4 or not r[0].strip():
+                continue
+            versions.setdefault(int(r[0]), {}).setdefault(int(r[1]), {})[int(r[2])] = r[3]
+        codes = list(versions)
+        table = {}
+        for part in sorted({part for answers in versions.values() for part in answers}):
+            width = max(max(answers.get(part, {0: ""})) for answers in versions.values())
+            table[part] = [
+                [versions[code].get(part, {}).get(q, "") for q in range(1, width + 1)] for code in codes
+            ]
+        return cls(codes, table)
+
+    def version_index(self, ma_de):
+        """Vị trí của từng mã đề trong codes; mã đề không có trong lô -> -1."""
+        ma_de = np.asarray(ma_de, dtype=np.int64)
+        if not len(self.codes):
+            return np.full(len(ma_de), -1, dtype=np.intp)
+        order = np.argsort(self.codes, kind="stable")
+        sorted_codes = self.codes[order]
+        pos = np.minimum(np.searchsorted(sorted_codes, ma_de), len(sorted_codes) - 1)
+        found = sorted_codes[pos] == ma_de
+        return np.where(found, order[pos], -1)
+
+
+def _pad_table(table):
+    out = {}
+    for part, rows in table.items():
+        width = max((len(r) for r in rows), default=0)
+        matrix = np.full((len(rows), width), "", dtype=object)
+        for v, r in enumerate(rows):
+            matrix[v, :len(r)] = r
+        out[part] = matrix
+    return out
+
+
+def normalize_short_answer(value) -> str:
+    """'1,50' / ' 1.5 ' -> '1.5'; không phải số thì bỏ khoảng trắng + viết hoa."""
+    text = re.sub(r"\s+", "", str(value or "")).replace(",", ".").upper()
+    try:
+        number = float(text)
+    except ValueError:
+        return text
+    return format(number, ".10g")
+
+
+def _mcq_code(value):
+    return _MCQ_CODES.get(str(value or "").strip().upper(), _BLANK)
+
+
+def _tf_codes(value, width=4):
+    """'ĐSĐS' -> [1, 0, 1, 0]; ký tự khác (trống, '-', '?') -> -1 (không được điểm ý đó)."""
+    codes = [_TF_CODES.get(ch, _BLANK) for ch in str(value or "").strip().upper()[:width]]
+    return codes + [_BLANK] * (width - len(codes))
+
+
+def encode_columns(columns, encode, dtype):
+    """
+    Mã hóa các cột chuỗi thành mảng (số dòng, số cột[, ...]): mỗi giá trị khác nhau chỉ gọi encode 1 lần
+    (phiếu trả lời lặp lại rất nhiều: A-D, ĐSĐS...), phần còn lại là tra bảng bằng numpy.
+    """
+    cache = {"": 0}
+    idx = np.stack([
+        np.fromiter((cache.setdefault(v, len(cache)) for v in col), dtype=np.intp, count=len(col))
+        for col in columns
+    ], axis=1)
+    table = np.array([encode(v) for v in cache], dtype=dtype)
+    return table[idx]
+
+
+def read_responses_csv(data: bytes):
+    """
+    Phiếu trả lời của học sinh: CSV cùng cột với DAPAN_THEO_MA_DE.csv + cột số báo danh
+    (sbd, ma_de, P1.C1, ..., P2.C1 = 'ĐSĐS', ..., P3.C1, ...).
+    Trả về {"sbd": [...], "ma_de": mảng int, "answers": {(phần, câu): [giá trị theo dòng]}}.
+    """
+    rows = csv.reader(io.StringIO(data.decode("utf-8-sig")))
+    header = [h.strip() for h in next(rows, [])]
+    lower = [h.lower() for h in header]
+    id_col = next((lower.index(c) for c in STUDENT_ID_COLUMNS if c in lower), None)
+    code_col = next((lower.index(c) for c in MA_DE_COLUMNS if c in lower), None)
+    if code_col is None:
+        raise Exception("File bài làm thiếu cột 'ma_de'.")
+    answer_cols = {}
+    for j, h in enumerate(header):
+        m = KEY_COLUMN_RE.match(h.upper())
+        if m:
+            answer_cols[(int(m.group(1)), int(m.group(2)))] = j
+
+    width = len(header)
+    body = [r + [""] * (width - len(r)) for r in rows if any(cell.strip() for cell in r)]
+    columns = list(zip(*body))
+    n = len(body)
+
+    def column(j):
+        if j is None or not columns:
+            return [""] * n
+        return columns[j]
+
+    ma_de = np.fromiter((int(v) if v.strip().isdigit() else -1 for v in column(code_col)), dtype=np.int64, count=n)
+    sbd = list(column(id_col)) if id_col is not None else [str(i + 1) for i in range(n)]
+    return {"sbd": sbd, "ma_de": ma_de, "answers": {key: column(j) for key, j in answer_cols.items()}}
+
+
+def grade_responses(key, responses, short_point=SHORT_POINT):
+    """
+    Chấm toàn bộ bài bằng phép toán mảng: mỗi phần là 1 ma trận (số bài, số câu) so với đáp án
+    của đúng mã đề từng bài (key.table[phần][version_index]).
+    Trả về {"sbd", "ma_de", "scores": {phần: (N,)}, "total": (N,), "unknown": số bài sai mã đề, "stats": [...]}.
+    """
+    vidx = key.version_index(responses["ma_de"])
+    known = vidx >= 0
+    rows = np.where(known, vidx, 0)
+    n = len(vidx)
+    answers = responses["answers"]
+    scores = {}
+    stats = []
+
+    for part in sorted(key.table):
+        matrix = key.table[part]
+        n_q = matrix.shape[1]
+        if not len(matrix) or not n_q:
+            continue
+        key_columns = [matrix[:, q].tolist() for q in range(n_q)]
+        student = [answers.get((part, q + 1), [""] * n) for q in range(n_q)]
+
+        if part == 1:
+            k = encode_columns(key_columns, _mcq_code, np.int8)[rows]
+            correct = (encode_columns(student, _mcq_code, np.int8) == k) & (k != _BLANK)
+            points = correct * MCQ_POINT
+            rate = correct
+        elif part == 2:
+            k = encode_columns(key_columns, _tf_codes, np.int8)[rows]
+            hits = ((encode_columns(student, _tf_codes, np.int8) == k) & (k != _BLANK)).sum(axis=2)
+            points = TF_POINTS[hits]
+            rate = hits / 4.0
+        else:
+            # đáp án ngắn: chuẩn hóa ('1,5' = '1.50') rồi đánh số chung cho cả đáp án lẫn bài làm
+            ids = {}
+
+            def intern(value):
+                return ids.setdefault(normalize_short_answer(value), len(ids))
+
+            blank = intern("")
+            k = encode_columns(key_columns, intern, np.int64)[rows]
+            correct = (encode_columns(student, intern, np.int64) == k) & (k != blank)
+            points = correct * short_point
+            rate = correct
+
+        points = np.where(known[:, None], points, 0.0)
+        scores[part] = points.sum(axis=1)
+        stats.extend(_question_stats(key, part, rows[known], points[known], rate[known]))
+
+    total = np.round(sum(scores.values(), np.zeros(n)), 2)
+    return {
+        "sbd": responses["sbd"],
+        "ma_de": responses["ma_de"],
+        "scores": {part: np.round(v, 2) for part, v in scores.items()},
+        "total": total,
+        "unknown": int((~known).sum()),
+        "stats": stats,
+    }
+
+
+def _question_stats(key, part, rows, points, rate):
+    """Tỉ lệ đúng + điểm TB từng câu; có origin thì gộp theo câu đề gốc, không thì theo vị trí câu trong đề."""
+    n_q = points.shape[1]
+    if key.origin is not None and part in key.origin:
+        question = key.origin[part][rows].astype(np.intp)
+    else:
+        question = np.broadcast_to(np.arange(n_q), points.shape)
+    count = np.bincount(question.ravel(), minlength=n_q)
+    rate_sum = np.bincount(question.ravel(), weights=np.asarray(rate, dtype=float).ravel(), minlength=n_q)
+    point_sum = np.bincount(question.ravel(), weights=points.ravel(), minlength=n_q)
+    safe = np.maximum(count, 1)
+    return [
+        {
+            "Phần": part,
+            "Câu": q + 1,
+            "Số bài": int(count[q]),
+            "Tỉ lệ đúng (%)": round(float(rate_sum[q] / safe[q] * 100), 1),
+            "Điểm TB": round(float(point_sum[q] / safe[q]), 3),
+        }
+        for q in range(n_q)
+    ]
+
+
+def score_csv_pieces(result):
+    """CSV điểm từng học sinh: sbd, ma_de, diem_p1..p3, tong."""
+    parts = sorted(result["scores"])
+
+    def rows():
+        yield ["sbd", "ma_de"] + [f"diem_p{part}" for part in parts] + ["tong"]
+        columns = [result["scores"][part].tolist() for part in parts]
+        for i, (sbd, ma_de, total) in enumerate(zip(result["sbd"], result["ma_de"].tolist(), result["total"].tolist())):
+            yield [sbd, ma_de] + [col[i] for col in columns] + [total]
+
+    return _csv_lines(rows())
+
+
+# ==================== CHẠY NỀN (BACKGROUND JOB) ====================
+
+def estimate_batch_memory(template, num_versions, workers=1) -> int:
+    """
+    RAM ước tính (byte) của 1 lô: template + các file .docx đang dựng dở (serial 1, pool tới 2*workers
+    cộng bản sao template trong mỗi worker) + phần ZIP tạm còn nằm trong RAM
+    (≈ kích thước đề × số mã đề, tối đa TRON_DE_SPOOL_MB rồi chuyển xuống đĩa).
+    """
+    docx = template.nbytes()
+    spool_max = int(os.environ.get("TRON_DE_SPOOL_MB", "32")) * 1024 * 1024
+    in_flight = 1 if workers <= 1 else 3 * workers
+    return docx * (1 + in_flight) + min(docx * num_versions, spool_max)
+
+
+class BatchJob:
+    """
+    Trộn cả lô (build_batch_zip) trên 1 thread riêng: script Streamlit không bị treo,
+    mỗi lần rerun chỉ đọc tiến độ / kết quả. Thread nền không gọi st.* nào.
+    """
+
+    def __init__(self, template, plan, base_name, ma_de_mode, seed, workers=1, rendered=None,
+                 answer_formats=DEFAULT_ANSWER_FORMATS):
+        self.template = template
+        self.plan = plan
+        self.base_name = base_name
+        self.ma_de_mode = ma_de_mode
+        self.seed = seed
+        self.workers = workers
+        self.rendered = rendered
+        self.answer_formats = tuple(answer_formats)
+        self.total = len(plan.codes)
+        self.memory = estimate_batch_memory(template, self.total, workers)
+        self.done = 0
+        self.status = "pending"  # pending | queued | running | done | cancelled | error
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished = None
+        self.on_finish = None  # BatchScheduler gắn vào để nhả slot khi lô kết thúc
+        self._scheduler = None
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"tron-de-{base_name}", daemon=True)
+
+    @property
+    def running(self) -> bool:
+        return self.status in ("pending", "queued", "running")
+
+    def start(self):
+        self.started = time.time()
+        self.status = "running"
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self._cancel.set()
+        if self._scheduler is not None:
+            self._scheduler.withdraw(self)
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def eta(self):
+        """Số giây còn lại ước theo tốc độ trung bình; chưa xong mã đề nào thì None."""
+        if not self.done or not self.running:
+            return None
+        return self.elapsed() / self.done * (self.total - self.done)
+
+    def _progress(self, done, total):
+        self.done = done
+
+    def _run(self):
+        spool = open_batch_spool()
+        try:
+            build_batch_zip(
+                self.template, self.plan, self.base_name, self.ma_de_mode, self.seed,
+                workers=self.workers, rendered=self.rendered, out=spool,
+                progress=self._progress, cancel=self._cancel, answer_formats=self.answer_formats
+            )
+        except BatchCancelled:
+            spool.close()
+            self.status = "cancelled"
+        except Exception as e:
+            spool.close()
+            self.error = str(e)
+            self.status = "error"
+        else:
+            self.result = spool
+            self.status = "done"
+        finally:
+            self.rendered = None
+            self.finished = time.time()
+            if self.on_finish is not None:
+                self.on_finish(self)
+
+
+class RenderSlot:
+    """
+    Chỗ trong hàng đợi chung cho việc sinh vài mã đề ngay trong phiên (tải từng mã đề, lô 1 mã đề):
+    xếp hàng và tính tiến trình / RAM như 1 lô, nhưng chạy trên chính thread của phiên.
+    """
+
+    def __init__(self, template, num_versions=1, workers=1):
+        self.template = template
+        self.total = num_versions
+        self.workers = workers
+        self.memory = 0
+        self.status = "pending"  # pending | queued | running | cancelled
+        self.finished = None
+        self._started = threading.Event()
+
+    def start(self):
+        self.status = "running"
+        self._started.set()
+
+    def wait(self, timeout=None) -> bool:
+        return self._started.wait(timeout)
+
+
+class BatchScheduler:
+    """
+    Hàng đợi trộn dùng chung cho mọi phiên trên server (FIFO, lô đầu hàng chưa vừa thì lô sau cũng chờ).
+    Lô được chạy khi tổng tiến trình (slot = workers của lô) và tổng RAM ước tính của các lô đang chạy
+    còn đủ; hàng đợi đầy hoặc 1 lô vượt ngân sách RAM -> từ chối ngay, không để server bị OOM.
+    Mọi đường sinh .docx của giao diện đều qua đây: lô ZIP bằng submit() (thread nền),
+    từng mã đề / lô 1 mã đề bằng run_now() (chờ tới lượt rồi chạy ngay trong phiên).
+    """
+
+    def __init__(self, max_workers, memory_budget, max_queue):
+        self.max_workers = max(1, int(max_workers))
+        self.memory_budget = int(memory_budget)
+        self.max_queue = max(0, int(max_queue))
+        self._lock = threading.Lock()
+        self._queue = deque()
+        self._running = []
+
+    def submit(self, job):
+        """Xếp hàng lô `job` (workers bị cắt về max_workers); quá tải thì raise Exception."""
+        self._size(job)
+        with self._lock:
+            self._enqueue(job)
+            job.on_finish = self._finished
+            job._scheduler = self
+            self._dispatch()
+        return job
+
+    def run_now(self, template, render, num_versions=1, workers=1, timeout=60.0):
+        """
+        Chờ tới lượt trong hàng đợi chung rồi gọi render() ngay trên thread hiện tại, xong thì nhả chỗ.
+        Quá tải hoặc chờ quá `timeout` giây -> raise Exception.
+        """
+        slot = RenderSlot(template, num_versions, workers)
+        self._size(slot)
+        with self._lock:
+            self._enqueue(slot)
+            self._dispatch()
+        if not slot.wait(timeout):
+            self.withdraw(slot)
+            if slot.status != "running":
+                raise Exception("Máy chủ đang bận trộn các lô khác. Thầy cô vui lòng thử lại sau ít phút.")
+        try:
+            return render()
+        finally:
+            self._finished(slot)
+
+    def withdraw(self, job):
+        """Bỏ lô còn trong hàng đợi (lô đang chạy tự dừng qua cancel event)."""
+        with self._lock:
+            if job in self._queue:
+                self._queue.remove(job)
+                job.status = "cancelled"
+                job.finished = time.time()
+                self._dispatch()
+
+    def position(self, job) -> int:
+        """Vị trí của lô trong hàng đợi (1 = chạy kế tiếp); không còn chờ thì 0."""
+        with self._lock:
+            try:
+                return self._queue.index(job) + 1
+            except ValueError:
+                return 0
+
+    def stats(self):
+        """Số lô đang chạy / đang chờ và tổng tiến trình, RAM đang dùng (hiển thị cạnh hàng đợi)."""
+        with self._lock:
+            return {
+                "running": len(self._running),
+                "queued": len(self._queue),
+                "workers": sum(job.workers for job in self._running),
+                "memory": sum(job.memory for job in self._running),
+            }
+
+    def _size(self, job):
+        job.workers = max(1, min(int(job.workers), self.max_workers))
+        job.memory = estimate_batch_memory(job.template, job.total, job.workers)
+        if job.memory > self.memory_budget:
+            raise Exception(
+                f"Lô đề quá lớn cho máy chủ (ước tính {job.memory / 2**20:,.0f} MB RAM, "
+                f"giới hạn {self.memory_budget / 2**20:,.0f} MB). Hãy giảm số mã đề hoặc số tiến trình."
+            )
+
+    def _enqueue(self, job):
+        must_wait = bool(self._queue) or not self._fits(job)
+        if must_wait and len(self._queue) >= self.max_queue:
+            raise Exception(
+                f"Máy chủ đang quá tải ({len(self._running)} lô đang trộn, {len(self._queue)} lô đang chờ). "
+                "Thầy cô vui lòng thử lại sau ít phút."
+            )
+        job.status = "queued"
+        self._queue.append(job)
+
+    def _fits(self, job) -> bool:
+        if not self._running:
+            return True
+        workers = sum(j.workers for j in self._running) + job.workers
+        memory = sum(j.memory for j in self._running) + job.memory
+        return workers <= self.max_workers and memory <= self.memory_budget
+
+    def _dispatch(self):
+        while self._queue and self._fits(self._queue[0]):
+            job = self._queue.popleft()
+            self._running.append(job)
+            job.start()
+
+    def _finished(self, job):
+        with self._lock:
+            if job in self._running:
+                self._running.remove(job)
+            self._dispatch()
+
+
+# ==================== DÒNG LỆNH (CLI) ====================
+
+BASE_NAME_RE = re.compile(r"[^\w\s-]")
+
+
+def safe_base_name(filename: str) -> str:
+    """Tên file gốc (bỏ đuôi, bỏ ký tự lạ) dùng đặt tên các mã đề; rỗng thì 'De'."""
+    base_name = os.path.basename(filename).rsplit(".", 1)[0]
+    return BASE_NAME_RE.sub("", base_name).strip() or "De"
+
+
+def build_arg_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m tron_de",
+        description="Trộn đề Word (3 phần) hàng loạt, không cần giao diện web."
+    )
+    parser.add_argument("files", nargs="+", help="file .docx gốc (1 hoặc nhiều)")
+    parser.add_argument("-n", "--versions", type=int, default=4, help="số mã đề mỗi file (mặc định 4)")
+    parser.add_argument("--start", type=int, default=101, help="mã đề bắt đầu, 1..999 (mặc định 101)")
+    parser.add_argument("--ma-de-mode", choices=["full", "2dau", "2cuoi"], default="full",
+                        help="điền {{MA_DE}} theo đủ 3 số / 2 số đầu / 2 số cuối")
+    parser.add_argument("--seed", default="", help="seed lô đề (bỏ trống = ngẫu nhiên, mỗi file 1 seed)")
+    parser.add_argument("--workers", type=int, default=1, help="số tiến trình song song (mặc định 1)")
+    parser.add_argument("--answers", default=",".join(DEFAULT_ANSWER_FORMATS),
+                        help="file đáp án trong ZIP, cách nhau dấu phẩy: " + ", ".join(ANSWER_EXPORTS))
+    parser.add_argument("-o", "--output", default=".", help="thư mục ghi file ZIP (mặc định thư mục hiện tại)")
+    parser.add_argument("--strict", action="store_true", help="bỏ qua file có lỗi cấu trúc (thiếu đáp án...)")
+    return parser
+
+
+def run_cli(argv=None) -> int:
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.versions < 1:
+        parser.error("--versions phải >= 1")
+    if not 1 <= args.start <= 999 or args.start + args.versions - 1 > 999:
+        parser.error("mã đề phải nằm trong 1..999 (giảm --versions hoặc --start)")
+    formats = tuple(f.strip() for f in args.answers.split(",") if f.strip())
+    unknown = [f for f in formats if f not in ANSWER_EXPORTS]
+    if unknown or not formats:
+        parser.error(f"--answers không hợp lệ: {', '.join(unknown) or '(trống)'}")
+    os.makedirs(args.output, exist_ok=True)
+
+    failed = 0
+    for path in args.files:
+        try:
+            with open(path, "rb") as f:
+                file_bytes = f.read()
+            report = analyze_docx(file_bytes)
+            for message in report["errors"]:
+                print(f"[{path}] LỖI: {message}", file=sys.stderr)
+            if report["errors"] and (args.strict or not report["parts"]):
+                failed += 1
+                continue
+
+            base_name = safe_base_name(path)
+            seed = args.seed.strip() or new_batch_seed()
+            out_path = os.path.join(args.output, f"{base_name}_multi.zip")
+            started = time.time()
+            with open(out_path, "wb") as out:
+                create_zip_multiple(
+                    file_bytes, base_name, args.versions, "auto", args.ma_de_mode, args.start,
+                    seed=seed, workers=args.workers, out=out, answer_formats=formats
+                )
+            print(
+                f"{path}: {args.versions} mã đề ({args.start} -> {args.start + args.versions - 1}) "
+                f"-> {out_path} • seed {seed} • {time.time() - started:.2f}s"
+            )
+        except Exception as e:
+            print(f"[{path}] LỖI: {e}", file=sys.stderr)
+            failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_cli())
@@ -0,0 +1,743 @@
+"""
+Trộn Đề Word - giao diện Streamlit (app.py chỉ gọi main()).
+
+Module này được import 1 lần cho cả server: mỗi lần rerun Streamlit chỉ chạy lại app.py (vài dòng)
+rồi gọi main(), không định nghĩa lại hàm / biên dịch lại regex của lõi tron_de.
+"""
+
+import streamlit as st
+import os
+import hashlib
+import time
+
+from tron_de import (
+    ANSWER_EXPORTS,
+    AnswerKey,
+    BatchJob,
+    BatchScheduler,
+    DEFAULT_ANSWER_FORMATS,
+    DiskTemplateCache,
+    LRUByteCache,
+    SHORT_POINT,
+    SHORT_POINT_MATH,
+    analyze_docx,
+    build_answer_table_xlsx,
+    build_shuffle_plan,
+    cached_compile_template,
+    cached_render_versions,
+    grade_responses,
+    lookup_rendered_versions,
+    new_batch_seed,
+    read_responses_csv,
+    safe_base_name,
+    score_csv_pieces,
+)
+
+
+# ==================== UI STYLE ====================
+
+UI_CSS = """
+<style>
+:root{
+  --primary:#0d9488;
+  --primary2:#14b8a6;
+  --bg:#f6fbfb;
+  --card:#ffffff;
+  --text:#0f172a;
+  --muted:#64748b;
+}
+
+.stApp { background: var(--bg); }
+.block-container { padding-top: 1.2rem; padding-bottom: 2.5rem; }
+
+.hero{
+  background: linear-gradient(90deg, rgba(13,148,136,0.12), rgba(20,184,166,0.12));
+  border: 1px solid rgba(13,148,136,0.25);
+  border-radius: 18px;
+  padding: 18px 18px;
+  margin-bottom: 14px;
+}
+.hero h1{ margin:0; color: var(--text); font-size: 28px; }
+.hero p{ margin:6px 0 0 0; color: var(--muted); }
+
+.card{
+  background: var(--card);
+  border: 1px solid rgba(2,132,199,0.15);
+  border-radius: 16px;
+  padding: 16px 16px;
+  box-shadow: 0 6px 20px rgba(2,132,199,0.06);
+}
+
+.badge{
+  display:inline-block;
+  padding: 3px 10px;
+  border-radius: 999px;
+  background: rgba(13,148,136,0.12);
+  border: 1px solid rgba(13,148,136,0.25);
+  color: var(--primary);
+  font-size: 12px;
+  margin-right: 6px;
+}
+
+.hr{
+  height:1px;
+  background: rgba(100,116,139,0.18);
+  margin: 12px 0;
+}
+
+.stButton > button{
+  width:100%;
+  background: linear-gradient(90deg, var(--primary), var(--primary2));
+  color:#fff;
+  border:0;
+  border-radius: 12px;
+  padding: 0.85rem 1rem;
+  font-weight: 700;
+  font-size: 1.05rem;
+}
+.stButton > button:hover{
+  filter: brightness(0.95);
+  box-shadow: 0 10px 24px rgba(13,148,136,0.22);
+}
+
+footer{
+  color: var(--muted);
+  font-size: 12.5px;
+  text-align:center;
+  margin-top: 18px;
+}
+</style>
+"""
+
+
+def inject_style():
+    st.markdown(UI_CSS, unsafe_allow_html=True)
+
+
+# ==================== UI: TẢI TỪNG MÃ ĐỀ KHI CẦN ====================
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+@st.cache_resource
+def get_render_cache():
+    """Cache template + file .docx đã sinh, sống qua các lần rerun và dùng chung giữa các phiên."""
+    return LRUByteCache(int(os.environ.get("TRON_DE_CACHE_MB", "512")) * 1024 * 1024)
+
+
+@st.cache_resource
+def get_disk_cache():
+    """Cache template trên đĩa (TRON_DE_CACHE_DIR); không tạo được thư mục thì bỏ qua."""
+    directory = os.environ.get("TRON_DE_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "tron_de")
+    try:
+        return DiskTemplateCache(directory, int(os.environ.get("TRON_DE_DISK_CACHE_MB", "1024")) * 1024 * 1024)
+    except OSError:
+        return None
+
+
+@st.cache_resource
+def get_batch_scheduler():
+    """
+    Hàng đợi trộn chung của cả server:
+    TRON_DE_MAX_WORKERS (mặc định số CPU), TRON_DE_JOB_MEMORY_MB (1024), TRON_DE_MAX_QUEUE (16).
+    """
+    return BatchScheduler(
+        int(os.environ.get("TRON_DE_MAX_WORKERS", str(os.cpu_count() or 1))),
+        int(os.environ.get("TRON_DE_JOB_MEMORY_MB", "1024")) * 1024 * 1024,
+        int(os.environ.get("TRON_DE_MAX_QUEUE", "16"))
+    )
+
+
+try:
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    _DEFERRED_DOWNLOAD = hasattr(MediaFileManager, "add_deferred")
+except ImportError:
+    _DEFERRED_DOWNLOAD = False
+
+
+def zip_download_data(spool):
+    """
+    data cho st.download_button từ file ZIP tạm.
+    Streamlit có tải trễ (data là hàm) -> chỉ đọc file khi người dùng bấm tải; bản cũ thì đọc ngay.
+    """
+    def read():
+        spool.seek(0)
+        return spool.read()
+    return read if _DEFERRED_DOWNLOAD else read()
+
+
+def keep_batch_zip(spool):
+    """Giữ file ZIP tạm của phiên (đóng file của lần trộn trước để giải phóng RAM/đĩa)."""
+    old = st.session_state.get("batch_zip")
+    if old is not None and old is not spool:
+        old.close()
+    st.session_state["batch_zip"] = spool
+    return spool
+
+
+def _lazy_render_version(ma_de):
+    batch = st.session_state.get("lazy_batch")
+    if batch is None or ma_de in batch["rendered"]:
+        return
+    try:
+        batch["rendered"].update(get_batch_scheduler().run_now(
+            batch["template"],
+            lambda: cached_render_versions(
+                get_render_cache(), batch["template"], batch["plan"], batch["ma_de_mode"], batch["seed"],
+                codes=[ma_de]
+            )
+        ))
+    except Exception as e:
+        batch["error"] = str(e)
+
+
+def _lazy_build_zip():
+    batch = st.session_state.get("lazy_batch")
+    if batch is None or st.session_state.get("batch_job") is not None:
+        return
+    rendered = lookup_rendered_versions(
+        get_render_cache(), batch["template"], batch["plan"], batch["ma_de_mode"], batch["seed"]
+    )
+    rendered.update(batch["rendered"])
+    try:
+        start_batch_job(BatchJob(
+            batch["template"], batch["plan"], batch["base_name"], batch["ma_de_mode"], batch["seed"],
+            workers=batch["workers"], rendered=rendered, answer_formats=batch["answer_formats"]
+        ))
+    except Exception as e:
+        batch["error"] = str(e)
+
+
+def answer_rows_for_display(plan):
+    """Bảng đáp án dạng list dict (mỗi mã đề 1 dòng) để hiển thị bằng st.dataframe."""
+    rows = [{"Mã đề": int(code)} for code in plan.codes]
+    for part, matrix in plan.answer_table().items():
+        for v, values in enumerate(matrix.tolist()):
+            for i, ans in enumerate(values):
+                rows[v][f"P{part}.C{i + 1}"] = ans
+    return rows
+
+
+def show_lazy_batch():
+    """Kết quả chế độ 'tải từng mã đề': bảng đáp án có ngay, file .docx chỉ sinh khi bấm."""
+    batch = st.session_state.get("lazy_batch")
+    if batch is None:
+        return
+
+    codes = batch["codes"]
+    st.success(
+        f"✅ Đã lập kế hoạch trộn {len(codes)} mã đề ({codes[0]} → {codes[-1]}) "
+        f"cho **{batch['base_name']}**. Seed: **{batch['seed']}**"
+    )
+    st.dataframe(answer_rows_for_display(batch["plan"]), use_container_width=True, hide_index=True)
+    st.download_button(
+        label="📥 Tải xuống DAPAN_TONG_HOP.xlsx",
+        data=batch["xlsx"],
+        file_name="DAPAN_TONG_HOP.xlsx",
+        mime=XLSX_MIME,
+        use_container_width=True
+    )
+
+    st.markdown("**Từng mã đề** — bấm để tạo file, sau đó tải xuống:")
+    cols = st.columns(4)
+    for k, ma_de in enumerate(codes):
+        with cols[k % 4]:
+            file_name = f"{batch['base_name']}_V{ma_de}.docx"
+            if ma_de in batch["rendered"]:
+                st.download_button(
+                    label=f"📥 V{ma_de}",
+                    data=batch["rendered"][ma_de],
+                    file_name=file_name,
+                    mime=DOCX_MIME,
+                    key=f"lazy_dl_{ma_de}",
+                    use_container_width=True
+                )
+            else:
+                st.button(
+                    f"⚙️ Tạo V{ma_de}",
+                    key=f"lazy_make_{ma_de}",
+                    on_click=_lazy_render_version,
+                    args=(ma_de,),
+                    use_container_width=True
+                )
+
+    error = batch.pop("error", None)
+    if error:
+        st.error(f"❌ Lỗi: {error}")
+    # ZIP cả lô chạy nền qua hàng đợi chung; tiến độ / nút tải hiện ở show_batch_job
+    if st.session_state.get("batch_job") is None:
+        st.button("📦 Tạo ZIP tất cả mã đề", on_click=_lazy_build_zip, use_container_width=True)
+
+
+# ==================== UI: TIẾN ĐỘ TRỘN NỀN ====================
+
+def drop_batch_job():
+    """Bỏ lô nền của phiên (lô đang chạy thì hủy, không chạy tiếp vô ích)."""
+    job = st.session_state.pop("batch_job", None)
+    if job is not None and job.running:
+        job.cancel()
+
+
+def start_batch_job(job):
+    """Xếp lô vào hàng đợi chung; máy chủ quá tải thì raise Exception (lô cũ của phiên vẫn bị bỏ)."""
+    drop_batch_job()
+    st.session_state["batch_job"] = get_batch_scheduler().submit(job)
+    return job
+
+
+def _format_seconds(seconds) -> str:
+    seconds = int(round(seconds))
+    return f"{seconds // 60} phút {seconds % 60:02d} giây" if seconds >= 60 else f"{seconds} giây"
+
+
+def _poll_batch_job():
+    """Thanh tiến độ tự làm mới; lô xong / hủy / lỗi -> chạy lại cả trang để hiện kết quả."""
+    job = st.session_state.get("batch_job")
+    if job is None:
+        return
+    if not job.running:
+        st.rerun()
+    if job.status == "queued":
+        scheduler = get_batch_scheduler()
+        position = scheduler.position(job)
+        stats = scheduler.stats()
+        st.info(
+            f"🕒 Máy chủ đang bận ({stats['running']} lô đang trộn, {stats['workers']}/{scheduler.max_workers} "
+            f"tiến trình), lô **{job.base_name}** đang xếp hàng: vị trí **{position}**/{stats['queued']}. "
+            "Lô sẽ tự chạy khi tới lượt."
+        )
+        st.button("⛔ Hủy", key="cancel_batch_job", on_click=job.cancel, disabled=job.cancel_requested)
+        return
+    text = f"⏳ Đang trộn **{job.base_name}**: {job.done}/{job.total} mã đề • {_format_seconds(job.elapsed())}"
+    eta = job.eta()
+    if eta is not None:
+        text += f" • còn khoảng {_format_seconds(eta)}"
+    st.progress(job.done / job.total, text=text)
+    st.button("⛔ Hủy trộn", key="cancel_batch_job", on_click=job.cancel, disabled=job.cancel_requested)
+
+
+if hasattr(st, "fragment"):
+    _poll_batch_job = st.fragment(run_every=0.5)(_poll_batch_job)
+
+
+def rerun_while_batch_running():
+    """
+    Streamlit cũ chưa có fragment -> tự rerun cả trang để cập nhật tiến độ.
+    Gọi ở cuối main(), sau khi mọi tab và footer đã vẽ xong, để trang vẫn dùng được khi lô đang chạy.
+    """
+    if hasattr(st, "fragment"):
+        return
+    job = st.session_state.get("batch_job")
+    if job is not None and job.running:
+        time.sleep(0.5)
+        st.rerun()
+
+
+def show_batch_job():
+    """Kết quả lô trộn nền của phiên; vẫn còn sau mỗi lần rerun cho tới khi trộn lô mới."""
+    job = st.session_state.get("batch_job")
+    if job is None:
+        return
+
+    if job.running:
+        _poll_batch_job()
+        return
+
+    if job.status == "done":
+        keep_batch_zip(job.result)
+        st.success(
+            f"✅ Hoàn tất! Đã tạo {job.total} mã đề + đáp án "
+            f"({', '.join(ANSWER_EXPORTS[fmt][0] for fmt in job.answer_formats)}) trong {_format_seconds(job.elapsed())}. "
+            f"Seed: **{job.seed}** (có trong SEED.txt)"
+        )
+        st.download_button(
+            label=f"📦 Tải xuống {job.base_name}_multi.zip",
+            data=zip_download_data(job.result),
+            file_name=f"{job.base_name}_multi.zip",
+            mime="application/zip",
+            use_container_width=True
+        )
+    elif job.status == "cancelled":
+        st.warning(f"⛔ Đã hủy trộn **{job.base_name}** sau {job.done}/{job.total} mã đề.")
+    else:
+        st.error(f"❌ Lỗi: {job.error}")
+
+
+# ==================== UI: KIỂM TRA FILE KHI TẢI LÊN ====================
+
+def preflight_report(file_bytes):
+    """analyze_docx theo nội dung file (cache chung) -> rerun / phiên khác không phân tích lại."""
+    cache = get_render_cache()
+    key = ("preflight", hashlib.sha256(file_bytes).hexdigest())
+    report = cache.get(key)
+    if report is None:
+        try:
+            report = analyze_docx(file_bytes)
+        except Exception as e:
+            report = {"parts": [], "errors": [str(e)], "warnings": []}
+        size = sum(len(m) for m in report["errors"] + report["warnings"]) + 64 * len(report["parts"]) + 256
+        cache.put(key, report, size)
+    return report
+
+
+def _options_summary(counts):
+    distinct = sorted(set(counts))
+    if not distinct:
+        return ""
+    if len(distinct) == 1:
+        return f"{distinct[0]}/câu"
+    return ", ".join(str(c) for c in counts)
+
+
+def show_preflight(report):
+    """Báo cáo cấu trúc đề ngay dưới ô tải file."""
+    if report["parts"]:
+        lines = []
+        for part in report["parts"]:
+            line = f"**PHẦN {part['number']}**: {part['questions']} câu"
+            if part["number"] == 1:
+                line += f" • phương án: {_options_summary(part['options'])}"
+            elif part["number"] == 2:
+                line += f" • ý đúng/sai: {_options_summary(part['options'])}"
+            lines.append(line)
+        st.markdown("🔎 " + "  \n".join(lines))
+
+    if report["errors"]:
+        st.error("⚠️ Đề chưa hợp lệ:\n" + "\n".join(f"- {m}" for m in report["errors"]))
+    if report["warnings"]:
+        with st.expander(f"Lưu ý ({len(report['warnings'])})"):
+            st.markdown("\n".join(f"- {m}" for m in report["warnings"]))
+    if not report["errors"] and not report["warnings"]:
+        st.caption("✅ Cấu trúc đề hợp lệ: mọi câu đều có đáp án.")
+
+
+# ==================== UI: CHẤM BÀI ====================
+
+def session_plan():
+    """Kế hoạch trộn của lô gần nhất trong phiên (chạy nền hoặc tải từng mã đề), nếu có."""
+    job = st.session_state.get("batch_job")
+    if job is not None:
+        return job.plan
+    batch = st.session_state.get("lazy_batch")
+    return batch["plan"] if batch is not None else None
+
+
+def show_grade_result(result):
+    total = result["total"]
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Số bài", f"{len(total):,}")
+    if len(total):
+        c2.metric("Điểm TB", f"{total.mean():.2f}")
+        c3.metric("Cao nhất", f"{total.max():.2f}")
+        c4.metric("Thấp nhất", f"{total.min():.2f}")
+    if result["unknown"]:
+        st.warning(f"⚠️ {result['unknown']} bài có mã đề không thuộc lô đáp án (chấm 0 điểm).")
+
+    columns = {"SBD": result["sbd"], "Mã đề": result["ma_de"].tolist()}
+    for part, scores in sorted(result["scores"].items()):
+        columns[f"PHẦN {part}"] = scores.tolist()
+    columns["Tổng"] = total.tolist()
+    st.dataframe(columns, use_container_width=True, hide_index=True)
+    st.download_button(
+        label="📥 Tải xuống DIEM.csv",
+        data=b"".join(score_csv_pieces(result)),
+        file_name="DIEM.csv",
+        mime="text/csv",
+        use_container_width=True
+    )
+
+    st.markdown("**Thống kê từng câu**")
+    st.dataframe(result["stats"], use_container_width=True, hide_index=True)
+
+
+def grade_page():
+    """Tab chấm bài: đáp án của lô vừa trộn (hoặc file đáp án) + CSV bài làm -> điểm + thống kê."""
+    st.markdown('<div class="card">', unsafe_allow_html=True)
+    st.subheader("Chấm bài theo đáp án của lô đề")
+
+    plan = session_plan()
+    sources = (["session"] if plan is not None else []) + ["file"]
+    source = st.radio(
+        "Đáp án",
+        options=sources,
+        format_func=lambda x: {
+            "session": f"Lô vừa trộn ({len(plan) if plan is not None else 0} mã đề)",
+            "file": "Tải file đáp án (DAPAN_THEO_MA_DE.csv / DAPAN_DAI.csv / DAPAN.json)",
+        }[x],
+        horizontal=True
+    )
+    key_file = None
+    if source == "file":
+        key_file = st.file_uploader("File đáp án lấy từ ZIP của lô", type=["csv", "json"], key="grade_key_file")
+
+    responses_file = st.file_uploader(
+        "Bài làm của học sinh (.csv)",
+        type=["csv"],
+        key="grade_responses_file",
+        help="Cột: sbd, ma_de, P1.C1, P1.C2, ..., P2.C1 (ví dụ ĐSĐS), ..., P3.C1, ... — cùng tên cột với DAPAN_THEO_MA_DE.csv."
+    )
+    is_math = st.checkbox("Môn Toán (PHẦN 3: 0,5 điểm/câu)", value=False)
+    st.caption("Thang điểm 2025: PHẦN 1 mỗi câu 0,25 • PHẦN 2 đúng 1/2/3/4 ý được 0,1/0,25/0,5/1 điểm • PHẦN 3 mỗi câu 0,25.")
+
+    ready = responses_file is not None and (source == "session" or key_file is not None)
+    grade_btn = st.button("🧮 Chấm bài", use_container_width=True, disabled=not ready)
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    if grade_btn:
+        try:
+            with st.spinner("⏳ Đang chấm bài..."):
+                if source == "session":
+                    key = AnswerKey.from_plan(plan)
+                else:
+                    key = AnswerKey.from_file(key_file.getvalue(), key_file.name)
+                responses = read_responses_csv(responses_file.getvalue())
+                st.session_state["grade_result"] = grade_responses(
+                    key, responses, short_point=SHORT_POINT_MATH if is_math else SHORT_POINT
+                )
+        except Exception as e:
+            st.error(f"❌ Lỗi: {str(e)}")
+
+    result = st.session_state.get("grade_result")
+    if result is not None:
+        show_grade_result(result)
+
+
+# ==================== UI MAIN ====================
+
+def mix_page():
+    """Tab trộn đề: Bước 1-3 + kết quả lô (tải ngay / chạy nền / tải từng mã đề)."""
+    left, right = st.columns([1.15, 0.85], gap="large")
+
+    with left:
+        st.markdown('<div class="card">', unsafe_allow_html=True)
+        st.subheader("Bước 1 — Chọn file Word (.docx)")
+        uploaded_file = st.file_uploader(
+            "Kéo thả hoặc bấm để chọn file .docx",
+            type=["docx"]
+        )
+        preflight = None
+        if uploaded_file:
+            st.success(f"✅ Đã chọn: {uploaded_file.name}")
+            preflight = preflight_report(uploaded_file.getvalue())
+            show_preflight(preflight)
+
+        st.markdown('<div class="hr"></div>', unsafe_allow_html=True)
+
+        st.subheader("Bước 2 — Thiết lập trộn")
+        c1, c2 = st.columns(2)
+        with c1:
+            num_versions = st.number_input("Số mã đề", min_value=1, max_value=30, value=4, step=1)
+        with c2:
+            shuffle_mode = st.selectbox(
+                "Chế độ",
+                options=["auto"],
+                format_func=lambda x: "Tự động (PHẦN 1,2,3)"
+            )
+
+        c3, c4 = st.columns(2)
+        with c3:
+            start_code = st.number_input("Mã đề bắt đầu", min_value=1, max_value=999, value=101, step=1)
+        with c4:
+            ma_de_mode = st.selectbox(
+                "Điền {{MA_DE}} theo",
+                options=["full", "2dau", "2cuoi"],
+                format_func=lambda x: {
+                    "full": "Đầy đủ 3 số (ví dụ 101)",
+                    "2dau": "2 số đầu (ví dụ 10)",
+                    "2cuoi": "2 số cuối (ví dụ 01)"
+                }[x]
+            )
+
+        c5, c6 = st.columns(2)
+        with c5:
+            seed_input = st.text_input(
+                "Seed lô đề",
+                value="",
+                help="Để trống = tạo ngẫu nhiên. Nhập lại seed cũ để sinh lại đúng đề + đáp án của 1 mã đề bất kỳ."
+            )
+        with c6:
+            workers = st.number_input(
+                "Số tiến trình song song (CPU)",
+                min_value=1,
+                max_value=max(1, os.cpu_count() or 1),
+                value=1,
+                step=1,
+                help="Lớn hơn 1 thì các mã đề được trộn song song trên nhiều nhân CPU (kết quả không đổi)."
+            )
+
+        answer_formats = st.multiselect(
+            "File đáp án trong ZIP",
+            options=list(ANSWER_EXPORTS),
+            default=list(DEFAULT_ANSWER_FORMATS),
+            format_func=lambda x: f"{ANSWER_EXPORTS[x][0]} — {ANSWER_EXPORTS[x][1]}",
+            help="CSV/JSON dùng cho phần mềm chấm trắc nghiệm (OMR); bỏ .xlsx nếu không cần bảng Excel."
+        )
+
+        # chặn vượt 999
+        if int(start_code) + int(num_versions) - 1 > 999:
+            st.error("⚠️ Mã đề vượt quá 999. Hãy giảm 'Số mã đề' hoặc tăng/giảm 'Mã đề bắt đầu'.")
+            can_run = False
+        else:
+            can_run = True
+        if not answer_formats:
+            st.error("⚠️ Chọn ít nhất 1 file đáp án.")
+            can_run = False
+
+        # đề lỗi (thiếu đáp án...) bị chặn trước khi trộn, trừ khi thầy cô chủ động bỏ qua
+        if preflight is not None and preflight["errors"]:
+            if not preflight["parts"]:
+                can_run = False
+            elif not st.checkbox("Vẫn trộn dù đề còn lỗi ở Bước 1 (ô đáp án tương ứng sẽ để trống)", value=False):
+                can_run = False
+
+        lazy_mode = st.checkbox(
+            "Hiện bảng đáp án ngay, chỉ tạo file .docx của mã đề nào khi cần tải",
+            value=False,
+            help="Phù hợp khi chỉ cần 1-2 mã đề (thi lại, bổ sung). ZIP cả lô vẫn tạo được riêng."
+        )
+
+        st.info(
+            "📌 Trong Word/TextBox:\n"
+            "- Dùng **{{MA_DE}}** để điền theo lựa chọn ở trên.\n"
+            "- Hoặc dùng **{{MA_DE_2DAU}}**, **{{MA_DE_2CUOI}}** nếu muốn cố định 2 số đầu/cuối."
+        )
+
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        st.markdown('<div style="height:10px"></div>', unsafe_allow_html=True)
+
+        st.markdown('<div class="card">', unsafe_allow_html=True)
+        st.subheader("Bước 3 — Trộn & Tải xuống")
+        run_btn = st.button("🚀 Trộn đề ngay", use_container_width=True, disabled=not can_run)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+    with right:
+        st.markdown('<div class="card">', unsafe_allow_html=True)
+        st.subheader("Quy ước (mỗi ý 1 dòng)")
+        st.markdown(
+            """
+- **PHẦN 1:** đáp án đúng = **gạch chân** trong nội dung phương án (sau khi trộn **sẽ bỏ gạch chân**)  
+- **PHẦN 2:** gạch chân = **Đ**, không gạch chân = **S** → xuất **ĐSĐS** (sau khi trộn **sẽ bỏ gạch chân**)  
+- **PHẦN 3:** đọc **`Đáp án: ...`** và **xóa dòng đáp án** khỏi đề trộn  
+- File trả lời **XLSX** có **merge nhóm tiêu đề**, **kẻ bảng đẹp**
+"""
+        )
+        st.markdown('<div class="hr"></div>', unsafe_allow_html=True)
+        st.subheader("Kết quả xuất ra")
+        st.markdown(
+            """
+- Nhiều mã đề → tải **ZIP** gồm:
+  - `..._V<ma_de>.docx`
+  - `DAPAN_TONG_HOP.xlsx`
+  - tùy chọn: `DAPAN_DAI.csv`, `DAPAN_THEO_MA_DE.csv`, `DAPAN.json` cho phần mềm chấm
+  - `SEED.txt` (seed để sinh lại đúng từng mã đề)
+"""
+        )
+        st.markdown('</div>', unsafe_allow_html=True)
+
+    if run_btn:
+        if not uploaded_file:
+            st.error("⚠️ Thầy vui lòng chọn file .docx trước.")
+            return
+
+        try:
+            with st.spinner("⏳ Đang trộn đề + điền mã đề + tạo XLSX đáp án..."):
+                file_bytes = uploaded_file.getvalue()
+                base_name = safe_base_name(uploaded_file.name)
+
+                start_code_i = int(start_code)
+                num_versions_i = int(num_versions)
+                seed = seed_input.strip() or new_batch_seed()
+                st.session_state.pop("lazy_batch", None)
+                drop_batch_job()
+
+                cache = get_render_cache()
+                template = cached_compile_template(cache, file_bytes, shuffle_mode, disk_cache=get_disk_cache())
+                codes = [start_code_i + i for i in range(num_versions_i)]
+                plan = build_shuffle_plan(template, codes, seed)
+                if template.merged_nodes:
+                    st.caption(f"🧹 Đã gộp run cùng định dạng: bớt {template.merged_nodes:,} nút XML trong đề.")
+
+                if lazy_mode:
+                    st.session_state["lazy_batch"] = {
+                        "template": template,
+                        "plan": plan,
+                        "codes": codes,
+                        "base_name": base_name,
+                        "ma_de_mode": ma_de_mode,
+                        "seed": seed,
+                        "workers": int(workers),
+                        "answer_formats": answer_formats,
+                        "xlsx": build_answer_table_xlsx(plan.answers(), start_code=start_code_i),
+                        "rendered": {},
+                    }
+                elif num_versions_i == 1:
+                    ma_de = start_code_i
+                    shuffled_bytes = get_batch_scheduler().run_now(
+                        template, lambda: cached_render_versions(cache, template, plan, ma_de_mode, seed)
+                    )[ma_de]
+                    xlsx_bytes = build_answer_table_xlsx(plan.answers(), start_code=start_code_i)
+
+                    st.success(f"✅ Hoàn tất! Đã tạo đề V{ma_de} và bảng đáp án XLSX. Seed: **{seed}**")
+
+                    st.download_button(
+                        label=f"📥 Tải xuống {base_name}_V{ma_de}.docx",
+                        data=shuffled_bytes,
+                        file_name=f"{base_name}_V{ma_de}.docx",
+                        mime=DOCX_MIME,
+                        use_container_width=True
+                    )
+                    st.download_button(
+                        label="📥 Tải xuống DAPAN_TONG_HOP.xlsx",
+                        data=xlsx_bytes,
+                        file_name="DAPAN_TONG_HOP.xlsx",
+                        mime=XLSX_MIME,
+                        use_container_width=True
+                    )
+                else:
+                    # trộn trên thread nền, ghi dần từng mã đề vào file ZIP tạm; trang vẫn dùng được
+                    rendered = lookup_rendered_versions(cache, template, plan, ma_de_mode, seed)
+                    start_batch_job(BatchJob(
+                        template, plan, base_name, ma_de_mode, seed, workers=int(workers), rendered=rendered,
+                        answer_formats=answer_formats
+                    ))
+
+        except Exception as e:
+            st.error(f"❌ Lỗi: {str(e)}")
+
+    show_lazy_batch()
+    show_batch_job()
+
+
+def main():
+    inject_style()
+    st.markdown(
+        """
+<div class="hero">
+  <span class="badge">Giữ nguyên MathType & OLE</span>
+  <span class="badge">Tự điền mã đề trong TextBox</span>
+  <span class="badge">Xuất đáp án XLSX</span>
+  <h1>🎲 Trộn đề Word (3 phần) + Bảng đáp án tổng hợp (.xlsx)</h1>
+  <p>Xuất nhiều mã đề • 1 file đáp án duy nhất Excel đẹp • Đề trộn xong không lộ đáp án</p>
+</div>
+""",
+        unsafe_allow_html=True
+    )
+
+    tab_mix, tab_grade = st.tabs(["🎲 Trộn đề", "🧮 Chấm bài"])
+    with tab_mix:
+        mix_page()
+    with tab_grade:
+        grade_page()
+
+    st.markdown(
+        """
+<footer>
+  © 2026 Ngô Văn Tuấn - 0822010190
+</footer>
+""",
+        unsafe_allow_html=True
+    )
+
+    rerun_while_batch_running()